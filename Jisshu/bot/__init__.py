@@ -1,7 +1,11 @@
 import logging
 import logging.config
+import multiprocessing
 
-logging.config.fileConfig("logging.conf")
+# Spawned stream workers import this again, only the main process may open
+# the log file, which truncates it.
+if multiprocessing.parent_process() is None:
+    logging.config.fileConfig("logging.conf")
 logging.getLogger().setLevel(logging.INFO)
 logging.getLogger("pyrogram").setLevel(logging.ERROR)
 logging.getLogger("imdbpy").setLevel(logging.ERROR)
@@ -1,45 +1,178 @@
+import os
+import time
 import asyncio
+import hashlib
 import logging
 from info import *
 from pyrogram import Client
+from pyrogram.errors import FloodWait
 from Jisshu.util.config_parser import TokenParser
+from Jisshu.util.metrics import flood_waits
+from Jisshu.util.custom_dl import class_cache
 from . import multi_clients, work_loads, JisshuBot
 
+start_semaphore = asyncio.Semaphore(CLIENT_START_CONCURRENCY)
+# helper client id -> (token, session name), everything needed to restart it.
+client_tokens = {}
+# helper client id -> monotonic time its login FloodWait ends.
+flood_until = {}
+
+
+def session_name(token):
+    # Keyed by the token, so a replaced MULTI_TOKEN never reuses a stale session.
+    return "client-" + hashlib.sha256(token.encode()).hexdigest()[:16]
+
+
+async def start_client(client_id, token, name=None, retries=CLIENT_START_RETRIES):
+    """
+    Starts a helper client, reusing its session file from CLIENT_SESSION_DIR when
+    there is one so restarts skip the bot login and auth key exchange.
+    Retries with exponential backoff and returns None if every attempt fails.
+    A FloodWait longer than CLIENT_FLOOD_WAIT_LIMIT gives up right away and
+    leaves the client to supervise_clients once the wait is over.
+    """
+    if CLIENT_SESSION_DIR:
+        os.makedirs(CLIENT_SESSION_DIR, exist_ok=True)
+    for attempt in range(retries + 1):
+        try:
+            # Held only while logging in, a client waiting to retry frees its slot.
+            async with start_semaphore:
+                print(f"Starting - Client {client_id}")
+                client = await Client(
+                    name=name or session_name(token),
+                    api_id=API_ID,
+                    api_hash=API_HASH,
+                    bot_token=token,
+                    sleep_threshold=SLEEP_THRESHOLD,
+                    no_updates=True,
+                    in_memory=not CLIENT_SESSION_DIR,
+                    workdir=CLIENT_SESSION_DIR or ".",
+                ).start()
+            flood_until.pop(client_id, None)
+            return client_id, client
+        except FloodWait as e:
+            flood_waits.labels("auth.ImportBotAuthorization").inc()
+            delay = e.value
+            if delay > CLIENT_FLOOD_WAIT_LIMIT:
+                flood_until[client_id] = time.monotonic() + delay
+                logging.warning(
+                    f"Client - {client_id} has to wait {delay}s to log in, skipping it"
+                )
+                return
+        except Exception:
+            logging.error(f"Failed starting Client - {client_id} Error:", exc_info=True)
+            delay = 2**attempt
+        if attempt < retries:
+            logging.warning(f"Retrying Client - {client_id} in {delay}s")
+            await asyncio.sleep(delay)
+
+
+def add_client(client_id, client):
+    # multi_clients first, the stream server picks an id from work_loads.
+    multi_clients[client_id] = client
+    work_loads[client_id] = 0
+
+
+def remove_client(client_id):
+    work_loads.pop(client_id, None)
+    client = multi_clients.pop(client_id, None)
+    if client is not None:
+        class_cache.pop(client, None)
+    return client
+
 
 async def initialize_clients():
     multi_clients[0] = JisshuBot
     work_loads[0] = 0
+    if STREAM_WORKERS:
+        print("Additional clients are started by the stream workers")
+        return
     all_tokens = TokenParser().parse_from_env()
     if not all_tokens:
         print("No additional clients found, using default client")
         return
 
-    async def start_client(client_id, token):
-        try:
-            print(f"Starting - Client {client_id}")
-            if client_id == len(all_tokens):
-                await asyncio.sleep(2)
-                print("This will take some time, please wait...")
-            client = await Client(
-                name=str(client_id),
-                api_id=API_ID,
-                api_hash=API_HASH,
-                bot_token=token,
-                sleep_threshold=SLEEP_THRESHOLD,
-                no_updates=True,
-                in_memory=True,
-            ).start()
-            work_loads[client_id] = 0
-            return client_id, client
-        except Exception:
-            logging.error(f"Failed starting Client - {client_id} Error:", exc_info=True)
-
+    client_tokens.update({i: (token, None) for i, token in all_tokens.items()})
     clients = await asyncio.gather(
         *[start_client(i, token) for i, token in all_tokens.items()]
     )
-    multi_clients.update(dict(clients))
+    for client_id, client in filter(None, clients):
+        add_client(client_id, client)
+    asyncio.create_task(supervise_clients())
     if len(multi_clients) != 1:
         MULTI_CLIENT = True
         print("Multi-Client Mode Enabled")
     else:
         print("No additional clients were initialized, using default client")
+
+
+async def initialize_worker_clients(worker_no, workers):
+    """
+    Starts the MULTI_TOKEN clients owned by a stream worker, every worker-th token.
+    A worker without a token of its own streams through an extra, update-less
+    session of the main bot.
+    """
+    all_tokens = TokenParser().parse_from_env()
+    tokens = {i: t for i, t in all_tokens.items() if i % workers == worker_no}
+    if tokens:
+        client_tokens.update({i: (token, None) for i, token in tokens.items()})
+    else:
+        # Every worker may fall back to the main bot, keep their sessions apart.
+        client_tokens[0] = (BOT_TOKEN, f"worker{worker_no}-main")
+    clients = await asyncio.gather(
+        *[start_client(i, token, name) for i, (token, name) in client_tokens.items()]
+    )
+    for client_id, client in filter(None, clients):
+        add_client(client_id, client)
+    asyncio.create_task(supervise_clients())
+    print(f"Stream worker {worker_no} serving with clients {list(multi_clients)}")
+
+
+async def is_healthy(client):
+    if not client.is_connected:
+        return False
+    try:
+        await asyncio.wait_for(client.get_me(), timeout=15)
+    except FloodWait:
+        # Rate limited, but the connection itself is fine.
+        pass
+    except Exception:
+        return False
+    return True
+
+
+async def supervise_clients():
+    """
+    Checks every helper client each CLIENT_HEALTH_INTERVAL seconds. A client that
+    failed to start or stopped answering is taken out of rotation and restarted
+    with exponential backoff, then handed back to the stream server once it is up.
+    """
+    failures = {}
+    retry_at = {}
+    while True:
+        await asyncio.sleep(CLIENT_HEALTH_INTERVAL)
+        for client_id, (token, name) in client_tokens.items():
+            client = multi_clients.get(client_id)
+            if client is not None:
+                if await is_healthy(client):
+                    continue
+                logging.warning(f"Client {client_id} is unhealthy, restarting it")
+                remove_client(client_id)
+                try:
+                    await client.stop()
+                except Exception:
+                    pass
+            if time.monotonic() < max(
+                retry_at.get(client_id, 0), flood_until.get(client_id, 0)
+            ):
+                continue
+            started = await start_client(client_id, token, name, retries=0)
+            if started:
+                add_client(*started)
+                failures.pop(client_id, None)
+                retry_at.pop(client_id, None)
+                logging.info(f"Client {client_id} is back in rotation")
+            else:
+                failures[client_id] = failures.get(client_id, 0) + 1
+                delay = min(CLIENT_HEALTH_INTERVAL * 2 ** failures[client_id], 1800)
+                retry_at[client_id] = time.monotonic() + delay
@@ -0,0 +1,114 @@
+import time
+import asyncio
+import logging
+import ipaddress
+from aiohttp import web
+from Jisshu.bot import multi_clients
+from info import (
+    STREAM_PER_IP_LIMIT,
+    STREAM_PER_CLIENT_LIMIT,
+    STREAM_RATE_LIMIT,
+    STREAM_RETRY_AFTER,
+    TRUSTED_PROXIES,
+    ON_HEROKU,
+)
+
+trusted_proxies = [
+    ipaddress.ip_network(proxy, strict=False) for proxy in TRUSTED_PROXIES
+]
+# On Heroku every connection comes from the router, which appends the viewer's
+# address to X-Forwarded-For. Elsewhere only TRUSTED_PROXIES are believed, and
+# without them viewers behind a proxy can't be told apart.
+trust_forwarded = ON_HEROKU or bool(trusted_proxies)
+
+
+class Throttle:
+    def __init__(self, rate: int):
+        """Paces writes of a single connection to `rate` bytes per second (0 = off)."""
+        self.rate = rate
+        self.sent = 0
+        self.started = time.monotonic()
+
+    async def pace(self, nbytes: int) -> None:
+        if not self.rate:
+            return
+        self.sent += nbytes
+        ahead = self.sent / self.rate - (time.monotonic() - self.started)
+        if ahead > 0:
+            await asyncio.sleep(ahead)
+
+
+class AdmissionController:
+    def __init__(self, per_ip: int, per_client: int):
+        """
+        Keeps track of the streams currently being served.
+        attributes:
+            per_ip: concurrent streams a single IP may hold (0 = unlimited).
+            per_client: streams each bot client may serve, the global cap is this
+                multiplied by the number of running clients (0 = unlimited).
+        """
+        self.per_ip = per_ip
+        self.per_client = per_client
+        self.active = 0
+        self.by_ip = {}
+
+    @property
+    def capacity(self) -> int:
+        return self.per_client * max(len(multi_clients), 1)
+
+    def acquire(self, ip: str) -> bool:
+        if self.per_ip and self.by_ip.get(ip, 0) >= self.per_ip:
+            logging.debug(f"{ip} reached the limit of {self.per_ip} streams")
+            return False
+        if self.per_client and self.active >= self.capacity:
+            logging.debug(f"Stream server saturated with {self.active} streams")
+            return False
+        self.active += 1
+        self.by_ip[ip] = self.by_ip.get(ip, 0) + 1
+        return True
+
+    def release(self, ip: str) -> None:
+        self.active -= 1
+        self.by_ip[ip] -= 1
+        if not self.by_ip[ip]:
+            del self.by_ip[ip]
+
+
+admission = AdmissionController(
+    STREAM_PER_IP_LIMIT if trust_forwarded else 0, STREAM_PER_CLIENT_LIMIT
+)
+
+
+def is_trusted_proxy(ip: str) -> bool:
+    try:
+        address = ipaddress.ip_address(ip)
+    except ValueError:
+        return False
+    return any(address in network for network in trusted_proxies)
+
+
+def get_client_ip(request: web.Request) -> str:
+    # Anyone can send X-Forwarded-For, so it only counts when the connection
+    # comes from one of our reverse proxies (Heroku router, nginx...). Its last
+    # hop is the one that proxy added, the earlier ones come from the client.
+    forwarded = request.headers.get("X-Forwarded-For")
+    if forwarded and (ON_HEROKU or is_trusted_proxy(request.remote or "")):
+        return forwarded.split(",")[-1].strip()
+    return request.remote
+
+
+@web.middleware
+async def admission_middleware(request: web.Request, handler):
+    if request.match_info.route.name != "media":
+        return await handler(request)
+    ip = get_client_ip(request)
+    if not admission.acquire(ip):
+        raise web.HTTPServiceUnavailable(
+            text="503: Too many streams, try again later",
+            headers={"Retry-After": str(STREAM_RETRY_AFTER)},
+        )
+    request["throttle"] = Throttle(STREAM_RATE_LIMIT)
+    try:
+        return await handler(request)
+    finally:
+        admission.release(ip)
@@ -4,3 +4,7 @@ class InvalidHash(Exception):
 
 class FIleNotFound(Exception):
     message = "File not found"
+
+
+class NoClientAvailable(Exception):
+    message = "503: No client available, try again later"
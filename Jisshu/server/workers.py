@@ -0,0 +1,90 @@
+import queue
+import asyncio
+import logging
+import multiprocessing
+from aiohttp import web
+from info import PORT
+from Jisshu.util.metrics import mark_process_dead
+
+STATS_INTERVAL = 5
+
+# worker number -> {client id: active streams}, as last reported by the worker.
+worker_loads = {}
+processes = {}
+
+
+def run_worker(worker_no: int, workers: int, bot_username: str, stats) -> None:
+    """Entry point of a stream worker process."""
+    asyncio.run(serve(worker_no, workers, bot_username, stats))
+
+
+async def serve(worker_no: int, workers: int, bot_username: str, stats) -> None:
+    from utils import temp
+    from plugins import web_server
+    from Jisshu.bot import work_loads
+    from Jisshu.bot.clients import initialize_worker_clients
+
+    temp.U_NAME = bot_username
+    await initialize_worker_clients(worker_no, workers)
+    app = web.AppRunner(await web_server())
+    await app.setup()
+    # Every worker binds the same port, the kernel spreads connections over them.
+    await web.TCPSite(app, "0.0.0.0", PORT, reuse_port=True).start()
+    while True:
+        await asyncio.sleep(STATS_INTERVAL)
+        try:
+            stats.put_nowait((worker_no, dict(work_loads)))
+        except queue.Full:
+            pass
+
+
+def spawn_worker(worker_no: int, workers: int, bot_username: str, stats) -> None:
+    process = multiprocessing.get_context("spawn").Process(
+        target=run_worker,
+        args=(worker_no, workers, bot_username, stats),
+        name=f"stream-worker-{worker_no}",
+        daemon=True,
+    )
+    process.start()
+    processes[worker_no] = process
+
+
+async def start_workers(workers: int, bot_username: str) -> None:
+    """
+    Runs the web/stream server in `workers` separate processes, so streaming
+    never competes with the update handlers for this process' loop and GIL.
+    Workers report their loads back over a queue and are respawned if they die.
+    """
+    stats = multiprocessing.get_context("spawn").Queue(maxsize=workers * 4)
+    for worker_no in range(workers):
+        spawn_worker(worker_no, workers, bot_username, stats)
+    asyncio.create_task(supervise_workers(workers, bot_username, stats))
+
+
+async def supervise_workers(workers: int, bot_username: str, stats) -> None:
+    loop = asyncio.get_running_loop()
+    while True:
+        try:
+            worker_no, loads = await loop.run_in_executor(
+                None, stats.get, True, STATS_INTERVAL
+            )
+            worker_loads[worker_no] = loads
+        except queue.Empty:
+            pass
+        for worker_no, process in list(processes.items()):
+            if not process.is_alive():
+                logging.warning(
+                    f"Stream worker {worker_no} exited ({process.exitcode}), restarting"
+                )
+                worker_loads.pop(worker_no, None)
+                mark_process_dead(process.pid)
+                spawn_worker(worker_no, workers, bot_username, stats)
+
+
+def active_streams() -> int:
+    """Streams being served right now, by this process or by the workers."""
+    from Jisshu.bot import work_loads
+
+    if processes:
+        return sum(sum(loads.values()) for loads in worker_loads.values())
+    return sum(work_loads.values())
@@ -1,15 +1,90 @@
+import time
 import asyncio
 import logging
 from info import *
-from typing import Dict, Union
-from Jisshu.bot import work_loads
+from typing import AsyncGenerator, Dict, Iterator, Tuple, Union
+from Jisshu.bot import multi_clients, work_loads
 from pyrogram import Client, utils, raw
 from .file_properties import get_file_ids
 from pyrogram.session import Session, Auth
-from pyrogram.errors import AuthBytesInvalid
+from pyrogram.errors import AuthBytesInvalid, FloodWait
 from Jisshu.server.exceptions import FIleNotFound
+from Jisshu.util.metrics import (
+    active_streams,
+    cache_requests,
+    chunk_fetch_seconds,
+    chunk_sizes,
+    flood_waits,
+)
+from Jisshu.util.edge_cache import EDGE_BLOCK, edge_cache
 from pyrogram.file_id import FileId, FileType, ThumbnailSource
 
+# Telegram only accepts GetFile limits that are powers of two between 4 KB and
+# 1 MB, at 4 KB aligned offsets, without crossing a 1 MB boundary.
+MIN_CHUNK = 4 * 1024
+MAX_CHUNK = 1024 * 1024
+FIRST_CHUNK = 1 << (max(MIN_CHUNK, min(MAX_CHUNK, STREAM_FIRST_CHUNK)).bit_length() - 1)
+
+class_cache = {}
+# message id -> warm_edges task, so a file is warmed once at a time and the
+# running task stays referenced until it is done.
+warming: Dict[int, asyncio.Task] = {}
+
+
+def chunk_plan(from_bytes: int, until_bytes: int) -> Iterator[Tuple[int, int]]:
+    """
+    Yields the (offset, limit) GetFile requests covering `from_bytes`..`until_bytes`.
+    The first request is FIRST_CHUNK long for a fast first byte after a seek, and
+    each following one doubles until the 1 MB maximum is reached.
+    """
+    offset = from_bytes - from_bytes % MIN_CHUNK
+    target = FIRST_CHUNK
+    while offset <= until_bytes:
+        limit = min(target, MAX_CHUNK - offset % MAX_CHUNK)
+        limit = 1 << (limit.bit_length() - 1)
+        yield offset, limit
+        offset += limit
+        target = min(target * 2, MAX_CHUNK)
+
+
+def is_playable(mime_type: str) -> bool:
+    # Only players jump between the ends of a file, downloads read it in order.
+    return (mime_type or "").split("/")[0] in ("video", "audio")
+
+
+def get_streamer(client: Client) -> "ByteStreamer":
+    """
+    Returns the ByteStreamer of a client, creating and caching it on first use.
+    The streamer holds the FileId cache, so every caller should go through here.
+    """
+    if client in class_cache:
+        logging.debug("Using cached ByteStreamer object")
+        return class_cache[client]
+    logging.debug("Creating new ByteStreamer object")
+    tg_connect = ByteStreamer(client)
+    class_cache[client] = tg_connect
+    return tg_connect
+
+
+def warm_file(id: int) -> None:
+    """
+    Schedules caching the head and tail of a LOG_CHANNEL file on the least busy
+    client, so the first player to open a fresh stream link finds them warm.
+    """
+    if STREAM_WORKERS or not work_loads:
+        # The stream clients live in the worker processes, or none is up.
+        return
+    index = min(work_loads, key=work_loads.get)
+    start_warming(get_streamer(multi_clients[index]), id, index)
+
+
+def start_warming(tg_connect: "ByteStreamer", id: int, index: int) -> None:
+    if id in warming:
+        return
+    task = asyncio.create_task(tg_connect.warm_edges(id, index))
+    warming[id] = task
+    task.add_done_callback(lambda _: warming.pop(id, None))
+
 
 class ByteStreamer:
     def __init__(self, client: Client):
@@ -39,8 +114,11 @@ class ByteStreamer:
         or it'll generate the properties from the Message ID and cache them.
         """
         if id not in self.cached_file_ids:
+            cache_requests.labels("file_id", "miss").inc()
             await self.generate_file_properties(id)
             logging.debug(f"Cached file properties for message with ID {id}")
+        else:
+            cache_requests.labels("file_id", "hit").inc()
         return self.cached_file_ids[id]
 
     async def generate_file_properties(self, id: int) -> FileId:
@@ -160,65 +238,137 @@ class ByteStreamer:
             )
         return location
 
-    async def yield_file(
+    async def fetch_chunk(
         self,
-        file_id: FileId,
+        media_session: Session,
+        location,
+        offset: int,
+        chunk_size: int,
         index: int,
+    ) -> bytes:
+        """
+        Requests a single chunk of the file from the media session and records its latency.
+        """
+        start = time.perf_counter()
+        try:
+            r = await media_session.send(
+                raw.functions.upload.GetFile(
+                    location=location, offset=offset, limit=chunk_size
+                ),
+            )
+            return r.bytes if isinstance(r, raw.types.upload.File) else b""
+        except FloodWait:
+            flood_waits.labels("upload.GetFile").inc()
+            raise
+        finally:
+            chunk_fetch_seconds.labels(index).observe(time.perf_counter() - start)
+
+    async def get_chunk(
+        self,
+        file_id: FileId,
+        media_session: Session,
+        location,
         offset: int,
-        first_part_cut: int,
-        last_part_cut: int,
-        part_count: int,
         chunk_size: int,
-    ) -> Union[str, None]:
+        index: int,
+    ) -> Union[bytes, memoryview]:
+        """
+        Returns a chunk of the file. Chunks at the head and tail of the file come
+        from the shared edge cache, which is filled a whole block at a time.
+        """
+        block, start = divmod(offset, EDGE_BLOCK)
+        if not edge_cache.is_edge(file_id.file_size, block):
+            return await self.fetch_chunk(
+                media_session, location, offset, chunk_size, index
+            )
+        key = (file_id.unique_id, block)
+        data = edge_cache.get(key)
+        if data is None:
+            task = edge_cache.pending.get(key)
+            if task is None:
+                task = asyncio.create_task(
+                    self.fetch_chunk(
+                        media_session, location, block * EDGE_BLOCK, EDGE_BLOCK, index
+                    )
+                )
+                edge_cache.pending[key] = task
+                task.add_done_callback(lambda t: edge_cache.settle(key, t))
+            # Shielded so a reader hanging up doesn't cancel the others' download.
+            data = await asyncio.shield(task)
+        return memoryview(data)[start : start + chunk_size]
+
+    async def warm_edges(self, id: int, index: int) -> None:
+        """
+        Fetches the uncached head and tail blocks of a media file into the edge cache.
+        """
+        try:
+            file_id = await self.get_file_properties(id)
+            if not is_playable(file_id.mime_type):
+                return
+            media_session = await self.generate_media_session(self.client, file_id)
+            location = await self.get_location(file_id)
+            for block in edge_cache.missing(file_id.unique_id, file_id.file_size):
+                await self.get_chunk(
+                    file_id,
+                    media_session,
+                    location,
+                    block * EDGE_BLOCK,
+                    EDGE_BLOCK,
+                    index,
+                )
+        except Exception as e:
+            logging.debug(f"Couldn't warm the edges of message {id}: {e!r}")
+
+    async def yield_file(
+        self,
+        file_id: FileId,
+        index: int,
+        from_bytes: int,
+        until_bytes: int,
+    ) -> AsyncGenerator[Union[bytes, memoryview], None]:
         """
-        Custom generator that yields the bytes of the media file.
+        Custom generator that yields the bytes `from_bytes`..`until_bytes` of the media file.
+        Requests follow chunk_plan, so the first byte arrives after a small GetFile.
+        Edge chunks are sliced through a memoryview so no bytes are copied; the
+        consumer must write each chunk out before asking for the next one.
         Modded from <https://github.com/eyaadh/megadlbot_oss/blob/master/mega/telegram/utils/custom_download.py#L20>
         Thanks to Eyaadh <https://github.com/eyaadh>
         """
         client = self.client
         work_loads[index] += 1
+        active_streams.labels(index).inc()
         logging.debug(f"Starting to yielding file with client {index}.")
-        media_session = await self.generate_media_session(client, file_id)
-
-        current_part = 1
-        location = await self.get_location(file_id)
 
+        current_part = 0
         try:
-            r = await media_session.send(
-                raw.functions.upload.GetFile(
-                    location=location, offset=offset, limit=chunk_size
-                ),
-            )
-            if isinstance(r, raw.types.upload.File):
-                while True:
-                    chunk = r.bytes
-                    if not chunk:
-                        break
-                    elif part_count == 1:
-                        yield chunk[first_part_cut:last_part_cut]
-                    elif current_part == 1:
-                        yield chunk[first_part_cut:]
-                    elif current_part == part_count:
-                        yield chunk[:last_part_cut]
-                    else:
-                        yield chunk
-
-                    current_part += 1
-                    offset += chunk_size
-
-                    if current_part > part_count:
-                        break
+            media_session = await self.generate_media_session(client, file_id)
+            location = await self.get_location(file_id)
 
-                    r = await media_session.send(
-                        raw.functions.upload.GetFile(
-                            location=location, offset=offset, limit=chunk_size
-                        ),
-                    )
+            for offset, limit in chunk_plan(from_bytes, until_bytes):
+                chunk_sizes.observe(limit)
+                chunk = await self.get_chunk(
+                    file_id, media_session, location, offset, limit, index
+                )
+                if not chunk:
+                    break
+                current_part += 1
+                if offset < from_bytes or offset + len(chunk) > until_bytes + 1:
+                    yield memoryview(chunk)[
+                        max(from_bytes - offset, 0) : until_bytes + 1 - offset
+                    ]
+                else:
+                    yield chunk
+                if len(chunk) < limit:
+                    break
         except (TimeoutError, AttributeError):
             pass
         finally:
-            logging.debug("Finished yielding file with {current_part} parts.")
-            work_loads[index] -= 1
+            logging.debug(f"Finished yielding file with {current_part} parts.")
+            # The client may have been taken out of rotation meanwhile, and a
+            # restarted one under the same index starts its own count.
+            if multi_clients.get(index) is client and work_loads.get(index):
+                work_loads[index] -= 1
+            active_streams.labels(index).dec()
 
     async def clean_cache(self) -> None:
         """
@@ -0,0 +1,129 @@
+import time
+import asyncio
+import logging
+from collections import OrderedDict
+from pyrogram.errors import FloodWait
+from pyrogram.types import InputMediaDocument, InputMediaVideo, InputMediaAudio
+from Jisshu.util.metrics import flood_waits
+from info import DELIVERY_RATE, DELIVERY_BURST, DELIVERY_ALBUMS
+
+logger = logging.getLogger(__name__)
+
+# Telegram groups at most this many files into one album.
+ALBUM_SIZE = 10
+ALBUM_TYPES = {
+    "document": InputMediaDocument,
+    "video": InputMediaVideo,
+    "audio": InputMediaAudio,
+}
+
+
+class TokenBucket:
+    def __init__(self, rate: float, burst: int):
+        """Lets `burst` sends through at once, then `rate` per second."""
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self.lock = asyncio.Lock()
+
+    async def take(self) -> None:
+        async with self.lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(
+                    self.burst, self.tokens + (now - self.updated) * self.rate
+                )
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+    def pause(self, seconds: float) -> None:
+        """Holds every send for `seconds` after a FloodWait, then refills from empty."""
+        self.tokens = 0
+        self.updated = time.monotonic() + seconds
+
+
+buckets: "OrderedDict[int, TokenBucket]" = OrderedDict()
+
+
+def get_bucket(chat_id: int) -> TokenBucket:
+    bucket = buckets.pop(chat_id, None) or TokenBucket(DELIVERY_RATE, DELIVERY_BURST)
+    buckets[chat_id] = bucket
+    if len(buckets) > 10000:
+        buckets.popitem(last=False)
+    return bucket
+
+
+async def send(bucket, method, *args, **kwargs):
+    while True:
+        await bucket.take()
+        try:
+            return await method(*args, **kwargs)
+        except FloodWait as e:
+            flood_waits.labels(method.__name__).inc()
+            bucket.pause(e.value)
+            await asyncio.sleep(e.value)
+
+
+def batches(deliveries):
+    """Splits (file, caption, reply_markup) into runs of one file type, ALBUM_SIZE long."""
+    run = []
+    for item in deliveries:
+        if run and (
+            len(run) == ALBUM_SIZE or run[0][0].file_type != item[0].file_type
+        ):
+            yield run
+            run = []
+        run.append(item)
+    if run:
+        yield run
+
+
+async def send_files(client, chat_id, deliveries, albums=DELIVERY_ALBUMS):
+    """
+    Sends (file, caption, reply_markup) tuples to a chat within the chat's
+    rate limit and returns the sent messages. Batches go out one after another
+    so the files arrive in the order they were listed, every send waits on the
+    same bucket anyway. With `albums` set, runs of same type files go out as
+    albums, which can't carry buttons, so only files sent on their own keep
+    their reply_markup.
+    """
+    bucket = get_bucket(chat_id)
+
+    async def deliver(batch):
+        media_type = ALBUM_TYPES.get(batch[0][0].file_type)
+        if len(batch) > 1 and media_type:
+            return await send(
+                bucket,
+                client.send_media_group,
+                chat_id,
+                [
+                    media_type(media=file.file_id, caption=caption)
+                    for file, caption, _ in batch
+                ],
+            )
+        messages = []
+        for file, caption, reply_markup in batch:
+            messages.append(
+                await send(
+                    bucket,
+                    client.send_cached_media,
+                    chat_id=chat_id,
+                    file_id=file.file_id,
+                    caption=caption,
+                    reply_markup=reply_markup,
+                )
+            )
+        return messages
+
+    runs = batches(deliveries) if albums else ([item] for item in deliveries)
+    sent = []
+    for batch in runs:
+        try:
+            sent.extend(await deliver(batch))
+        except Exception as e:
+            logger.warning(f"Could not deliver a file to {chat_id}: {e}")
+    return sent
@@ -0,0 +1,81 @@
+import asyncio
+import logging
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+from Jisshu.util.metrics import cache_requests
+from info import STREAM_CACHE_SIZE, STREAM_EDGE_CHUNKS
+
+# Blocks are cached at Telegram's maximum GetFile size and alignment, so any
+# smaller aligned request falls entirely inside one block.
+EDGE_BLOCK = 1024 * 1024
+
+
+class EdgeCache:
+    def __init__(self, max_bytes: int, edge_blocks: int):
+        """
+        An LRU of the first and last blocks of streamed files, shared by all clients.
+        Players read the head, jump to the tail for the `moov` atom / cues and
+        only then seek, so keeping both ends warm saves two cold round trips.
+        attributes:
+            max_bytes: memory budget of the cache (0 disables it).
+            edge_blocks: number of blocks cached at each end of a file.
+            pending: in-flight block downloads, so concurrent readers share one.
+        """
+        self.max_bytes = max_bytes
+        self.edge_blocks = edge_blocks
+        self.size = 0
+        self.blocks: "OrderedDict[Tuple[str, int], bytes]" = OrderedDict()
+        self.pending: Dict[Tuple[str, int], asyncio.Task] = {}
+
+    def is_edge(self, file_size: int, block: int) -> bool:
+        if not self.max_bytes or not self.edge_blocks:
+            return False
+        last_block = (file_size - 1) // EDGE_BLOCK
+        return block < self.edge_blocks or block > last_block - self.edge_blocks
+
+    def edges(self, file_size: int):
+        last_block = (file_size - 1) // EDGE_BLOCK
+        return sorted(
+            {*range(min(self.edge_blocks, last_block + 1))}
+            | {*range(max(0, last_block - self.edge_blocks + 1), last_block + 1)}
+        )
+
+    def missing(self, unique_id: str, file_size: int):
+        if not self.max_bytes:
+            return []
+        return [
+            block
+            for block in self.edges(file_size)
+            if (unique_id, block) not in self.blocks
+            and (unique_id, block) not in self.pending
+        ]
+
+    def get(self, key: Tuple[str, int]) -> Optional[bytes]:
+        data = self.blocks.get(key)
+        if data is None:
+            cache_requests.labels("edge", "miss").inc()
+            return None
+        cache_requests.labels("edge", "hit").inc()
+        self.blocks.move_to_end(key)
+        return data
+
+    def put(self, key: Tuple[str, int], data: bytes) -> None:
+        if not data or key in self.blocks:
+            return
+        self.blocks[key] = data
+        self.size += len(data)
+        while self.size > self.max_bytes:
+            _, evicted = self.blocks.popitem(last=False)
+            self.size -= len(evicted)
+
+    def settle(self, key: Tuple[str, int], task: asyncio.Task) -> None:
+        self.pending.pop(key, None)
+        if task.cancelled():
+            return
+        if task.exception():
+            logging.debug(f"Fetching edge block {key} failed: {task.exception()!r}")
+            return
+        self.put(key, task.result())
+
+
+edge_cache = EdgeCache(STREAM_CACHE_SIZE * 1024 * 1024, STREAM_EDGE_CHUNKS)
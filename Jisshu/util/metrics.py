@@ -0,0 +1,158 @@
+import os
+import time
+import shutil
+import tempfile
+import logging
+import functools
+from info import STREAM_WORKERS, MONGO_SLOW_MS, PORT
+
+# Stream workers write their samples to a directory shared with every process,
+# it has to be known before prometheus_client is imported. Workers inherit it.
+# It is fixed and wiped on start, so earlier runs neither count nor pile up.
+if STREAM_WORKERS and "PROMETHEUS_MULTIPROC_DIR" not in os.environ:
+    metrics_dir = os.path.join(tempfile.gettempdir(), f"jisshu-metrics-{PORT}")
+    shutil.rmtree(metrics_dir, ignore_errors=True)
+    os.makedirs(metrics_dir)
+    os.environ["PROMETHEUS_MULTIPROC_DIR"] = metrics_dir
+
+from pymongo import monitoring
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+    multiprocess,
+)
+
+active_streams = Gauge(
+    "jisshu_active_streams",
+    "Streams currently served by a client",
+    ["client"],
+    multiprocess_mode="livesum",
+)
+bytes_served = Counter(
+    "jisshu_bytes_served_total", "Bytes streamed to HTTP clients", ["client"]
+)
+chunk_fetch_seconds = Histogram(
+    "jisshu_chunk_fetch_seconds",
+    "Latency of upload.GetFile calls",
+    ["client"],
+    buckets=(0.05, 0.1, 0.25, 0.5, 1, 2, 5, 10, 30),
+)
+chunk_sizes = Histogram(
+    "jisshu_chunk_size_bytes",
+    "Limits chosen for upload.GetFile calls",
+    buckets=tuple(4096 << i for i in range(9)),
+)
+flood_waits = Counter(
+    "jisshu_flood_waits_total", "FloodWait errors received from Telegram", ["method"]
+)
+cache_requests = Counter(
+    "jisshu_cache_requests_total", "Lookups in in-process caches", ["cache", "result"]
+)
+handler_seconds = Histogram(
+    "jisshu_handler_seconds", "Latency of bot update handlers", ["handler"]
+)
+mongo_seconds = Histogram(
+    "jisshu_mongo_command_seconds",
+    "Latency of MongoDB commands",
+    ["command"],
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 5),
+)
+mongo_slow_queries = Counter(
+    "jisshu_mongo_slow_queries_total",
+    "MongoDB commands slower than MONGO_SLOW_MS",
+    ["command", "collection"],
+)
+
+logger = logging.getLogger(__name__)
+
+
+def render_metrics():
+    """Returns the exposition of every process' metrics and its content type."""
+    registry = REGISTRY
+    if "PROMETHEUS_MULTIPROC_DIR" in os.environ:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    return generate_latest(registry), CONTENT_TYPE_LATEST
+
+
+def mark_process_dead(pid: int) -> None:
+    """Drops the live gauges of a dead stream worker from the totals."""
+    if "PROMETHEUS_MULTIPROC_DIR" in os.environ:
+        multiprocess.mark_process_dead(pid)
+
+
+def track_handler(func):
+    """Records the run time of a Pyrogram handler, apply it below the on_* decorator."""
+
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return await func(*args, **kwargs)
+        finally:
+            handler_seconds.labels(func.__name__).observe(time.perf_counter() - start)
+
+    return wrapper
+
+
+# Commands whose filter tells which index a slow query is missing.
+QUERY_COMMANDS = {
+    "find": "filter",
+    "count": "query",
+    "distinct": "query",
+    "findAndModify": "query",
+    "delete": "deletes",
+    "update": "updates",
+    "aggregate": "pipeline",
+}
+
+
+def query_shape(command, field):
+    """Returns the filtered field names of a command, without their values."""
+    value = command.get(field)
+    if field in ("deletes", "updates"):
+        value = value[0].get("q") if value else None
+    elif field == "pipeline":
+        matches = [stage["$match"] for stage in value or [] if "$match" in stage]
+        value = matches[0] if matches else None
+    return sorted(value) if isinstance(value, dict) else []
+
+
+class MongoCommandListener(monitoring.CommandListener):
+    def __init__(self):
+        # request_id -> (collection, filtered fields) of commands in flight.
+        self.queries = {}
+
+    def started(self, event):
+        field = QUERY_COMMANDS.get(event.command_name)
+        if MONGO_SLOW_MS and field:
+            collection = event.command.get(event.command_name)
+            shape = query_shape(event.command, field)
+            self.queries[event.request_id] = (collection, shape)
+
+    def finished(self, event):
+        seconds = event.duration_micros / 1_000_000
+        mongo_seconds.labels(event.command_name).observe(seconds)
+        query = self.queries.pop(event.request_id, None)
+        if query and seconds * 1000 >= MONGO_SLOW_MS:
+            collection, shape = query
+            mongo_slow_queries.labels(event.command_name, collection).inc()
+            logger.warning(
+                f"Slow {event.command_name} on {event.database_name}.{collection} "
+                f"by {shape} took {seconds * 1000:.0f}ms"
+            )
+
+    def succeeded(self, event):
+        self.finished(event)
+
+    def failed(self, event):
+        self.finished(event)
+
+
+# Passed as event_listeners to every Mongo client of the bot.
+mongo_listener = MongoCommandListener()
@@ -1,19 +1,29 @@
+import os
 import jinja2
-from info import URL, LOG_CHANNEL
+from info import URL
 from utils import temp
-from Jisshu.bot import JisshuBot
+from Jisshu.bot import multi_clients, work_loads
 from Jisshu.util.human_readable import humanbytes
-from Jisshu.util.file_properties import get_file_ids
-from Jisshu.server.exceptions import InvalidHash
+from Jisshu.util.custom_dl import get_streamer
+from Jisshu.server.exceptions import InvalidHash, NoClientAvailable
 from Template import jisshu_template
 import urllib.parse
 import logging
-import aiohttp
+
+template_env = jinja2.Environment(
+    loader=jinja2.FileSystemLoader(
+        os.path.join(os.path.dirname(os.path.dirname(__file__)), "template")
+    )
+)
+stream_template = template_env.get_template("req.html")
+download_template = template_env.get_template("dl.html")
 
 
 async def render_page(id, secure_hash, src=None):
-    file = await JisshuBot.get_messages(int(LOG_CHANNEL), int(id))
-    file_data = await get_file_ids(JisshuBot, int(LOG_CHANNEL), int(id))
+    if not work_loads:
+        raise NoClientAvailable
+    index = min(work_loads, key=work_loads.get)
+    file_data = await get_streamer(multi_clients[index]).get_file_properties(int(id))
     if file_data.unique_id[:6] != secure_hash:
         logging.debug(f"link hash: {secure_hash} - {file_data.unique_id[:6]}")
         logging.debug(f"Invalid hash for message with - ID {id}")
@@ -29,15 +39,9 @@ async def render_page(id, secure_hash, src=None):
     tag = file_data.mime_type.split("/")[0].strip()
     file_size = humanbytes(file_data.file_size)
     if tag in ["video", "audio"]:
-        template_file = "Jisshu/template/req.html"
+        template = stream_template
     else:
-        template_file = "Jisshu/template/dl.html"
-        async with aiohttp.ClientSession() as s:
-            async with s.get(src) as u:
-                file_size = humanbytes(int(u.headers.get("Content-Length")))
-
-    with open(template_file) as f:
-        template = jinja2.Template(f.read())
+        template = download_template
 
     file_name = file_data.file_name.replace("_", " ").replace(".", " ")
 
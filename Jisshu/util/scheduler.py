@@ -0,0 +1,125 @@
+import time
+import heapq
+import asyncio
+import logging
+from itertools import count
+from pyrogram.errors import FloodWait
+from database.users_chats_db import db
+from Jisshu.util.metrics import flood_waits
+
+logger = logging.getLogger(__name__)
+
+# Jobs falling due this close together are fired in the same pass.
+BATCH_WINDOW = 1
+# Telegram deletes at most this many messages per request.
+DELETE_LIMIT = 100
+
+
+class DeleteScheduler:
+    def __init__(self):
+        """
+        Deletes messages at a later time without keeping a handler waiting.
+        Jobs are stored in MongoDB so they survive restarts, and kept in a
+        min-heap ordered by due time so one task serves all of them.
+        attributes:
+            heap: (due_at, seq, job) for every pending job.
+            wakeup: set when a job due before the current head is added.
+        """
+        self.client = None
+        self.heap = []
+        self.seq = count()
+        self.wakeup = asyncio.Event()
+        self.task = None
+
+    async def start(self, client):
+        self.client = client
+        for job in await db.get_deletions():
+            self.push(job)
+        if self.heap:
+            logger.info(f"Restored {len(self.heap)} scheduled deletions")
+        self.task = asyncio.create_task(self.run())
+
+    def push(self, job):
+        heapq.heappush(self.heap, (job["due_at"], next(self.seq), job))
+
+    async def schedule(self, delay, chat_id, message_ids, edit_id=None, edit_text=None):
+        """
+        Deletes `message_ids` from `chat_id` after `delay` seconds, then
+        optionally replaces the text of message `edit_id` with `edit_text`.
+        """
+        job = {
+            "chat_id": chat_id,
+            "message_ids": [i for i in message_ids if i],
+            "due_at": time.time() + delay,
+        }
+        if edit_id:
+            job["edit"] = {"message_id": edit_id, "text": edit_text}
+        try:
+            job["_id"] = await db.add_deletion(job)
+        except Exception as e:
+            # Still delete on time, only a restart would lose this job.
+            logger.warning(f"Could not store scheduled deletion: {e}")
+        first = not self.heap or job["due_at"] < self.heap[0][0]
+        self.push(job)
+        if first:
+            self.wakeup.set()
+
+    async def run(self):
+        while True:
+            self.wakeup.clear()
+            timeout = self.heap[0][0] - time.time() if self.heap else None
+            if timeout is None or timeout > 0:
+                try:
+                    await asyncio.wait_for(self.wakeup.wait(), timeout)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            due = []
+            while self.heap and self.heap[0][0] <= time.time() + BATCH_WINDOW:
+                due.append(heapq.heappop(self.heap)[2])
+            try:
+                await self.fire(due)
+            except Exception as e:
+                logger.exception(f"Scheduled deletion failed: {e}")
+
+    async def fire(self, jobs):
+        for job in jobs:
+            await self.delete(job["chat_id"], job["message_ids"])
+            if "edit" in job:
+                await self.call(
+                    "edit_message_text",
+                    job["chat_id"],
+                    job["edit"]["message_id"],
+                    job["edit"]["text"],
+                )
+        stored = [job["_id"] for job in jobs if "_id" in job]
+        if stored:
+            await db.remove_deletions(stored)
+
+    async def delete(self, chat_id, message_ids):
+        for i in range(0, len(message_ids), DELETE_LIMIT):
+            chunk = message_ids[i : i + DELETE_LIMIT]
+            if await self.call("delete_messages", chat_id, chunk) or len(chunk) == 1:
+                continue
+            # One id the bot can't delete, like a user's message it has no
+            # rights over, fails the whole request. Retry the rest one by one.
+            for message_id in chunk:
+                await self.call("delete_messages", chat_id, message_id)
+
+    async def call(self, method, *args):
+        """Returns True once the call went through, False if it failed."""
+        while True:
+            try:
+                await getattr(self.client, method)(*args)
+                return True
+            except FloodWait as e:
+                flood_waits.labels(method).inc()
+                await asyncio.sleep(e.value)
+            except Exception as e:
+                # The messages were most likely deleted already or the bot
+                # lost access to the chat, nothing to retry.
+                logger.debug(f"{method} in {args[0]} failed: {e}")
+                return False
+
+
+delete_scheduler = DeleteScheduler()
@@ -0,0 +1,330 @@
+"""
+Offline benchmark for the stream server.
+
+Drives the real aiohttp app from `plugins.web_server()` and the real
+`ByteStreamer.yield_file`, but the Telegram side is replaced with fake media
+sessions that answer `upload.GetFile` from synthetic files. Latency, jitter and
+error injection are configurable, so prefetch/caching/balancing changes can be
+compared on one machine without a bot token.
+
+    python benchmarks/stream_bench.py --mode mixed --concurrency 32 --latency-ms 80
+
+It runs in a scratch directory, so it can be started from anywhere.
+"""
+
+import os
+import sys
+import time
+import atexit
+import random
+import shutil
+import asyncio
+import argparse
+import tempfile
+import statistics
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# Importing the bot configures logging from ./logging.conf, which truncates
+# ./TELEGRAM BOT.LOG, and Cinemagoer creates ./cinemagoer.db. Keep both out of
+# the checkout.
+WORKDIR = tempfile.mkdtemp(prefix="jisshu-bench-")
+shutil.copy(os.path.join(ROOT, "logging.conf"), WORKDIR)
+os.chdir(WORKDIR)
+atexit.register(shutil.rmtree, WORKDIR, True)
+
+# info.py reads these at import time, none of them are used to connect anywhere.
+for key, value in {
+    "API_ID": "1",
+    "API_HASH": "0" * 32,
+    "BOT_TOKEN": "1:benchmark",
+    "AUTH_CHANNEL": "-100",
+    "AUTH_REQ_CHANNEL": "-100",
+    "LOG_CHANNEL": "-100",
+    "LOG_API_CHANNEL": "-100",
+    "LOG_VR_CHANNEL": "-100",
+    "DATABASE_URI": "mongodb://127.0.0.1:1",
+    "FILES_DATABASE": "mongodb://127.0.0.1:1",
+    "STREAM_PER_IP_LIMIT": "0",
+    "STREAM_PER_CLIENT_LIMIT": "0",
+}.items():
+    os.environ.setdefault(key, value)
+
+import aiohttp
+import psutil
+from aiohttp import web
+from pyrogram import raw
+from pyrogram.errors import FloodWait
+from pyrogram.file_id import FileId, FileType
+from Jisshu.bot import multi_clients, work_loads
+from Jisshu.util.custom_dl import get_streamer
+from plugins import web_server
+
+MB = 1024 * 1024
+# A block a bit longer than 1 MiB, so consecutive chunks differ and any
+# misplaced byte shows up when the response is verified.
+BLOCK_SIZE = MB + 4099
+BLOCK = random.Random(0).randbytes(BLOCK_SIZE)
+BLOCK2 = BLOCK + BLOCK
+
+
+def synthetic(offset: int, length: int) -> bytes:
+    """Returns `length` (<= 1 MiB) bytes of a synthetic file starting at `offset`."""
+    start = offset % BLOCK_SIZE
+    return BLOCK2[start : start + length]
+
+
+class FakeMediaSession:
+    def __init__(self, file_sizes, latency, jitter, bandwidth, error_rate, flood_rate):
+        """
+        Answers upload.GetFile like a Telegram media DC would.
+        attributes:
+            file_sizes: media_id -> size of the synthetic file.
+            latency / jitter: seconds added to every request.
+            bandwidth: bytes per second of a single request (0 = unlimited).
+            error_rate: probability of a TimeoutError.
+            flood_rate: probability of a FloodWait.
+        """
+        self.file_sizes = file_sizes
+        self.latency = latency
+        self.jitter = jitter
+        self.bandwidth = bandwidth
+        self.error_rate = error_rate
+        self.flood_rate = flood_rate
+        self.requests = 0
+        self.rejected = 0
+
+    async def send(self, query, *args, **kwargs):
+        if not isinstance(query, raw.functions.upload.GetFile):
+            raise NotImplementedError(type(query).__name__)
+        self.requests += 1
+        transfer = query.limit / self.bandwidth if self.bandwidth else 0
+        await asyncio.sleep(self.latency + random.uniform(0, self.jitter) + transfer)
+        if random.random() < self.error_rate:
+            raise TimeoutError
+        if random.random() < self.flood_rate:
+            raise FloodWait(value=1)
+
+        offset, limit = query.offset, query.limit
+        # Same constraints the real DCs enforce.
+        if (
+            offset % 4096
+            or limit % 4096
+            or not 0 < limit <= MB
+            or MB % limit
+            or offset // MB != (offset + limit - 1) // MB
+        ):
+            self.rejected += 1
+            raise ValueError(f"LIMIT_INVALID or OFFSET_INVALID ({offset}, {limit})")
+
+        size = self.file_sizes[query.location.id]
+        length = max(0, min(limit, size - offset))
+        return raw.types.upload.File(
+            type=raw.types.storage.FileUnknown(),
+            mtime=0,
+            bytes=synthetic(offset, length),
+        )
+
+
+class FakeClient:
+    def __init__(self, session: FakeMediaSession):
+        self.media_sessions = {1: session}
+
+
+def make_file_id(media_id: int, size: int) -> FileId:
+    file_id = FileId(
+        file_type=FileType.DOCUMENT,
+        dc_id=1,
+        media_id=media_id,
+        access_hash=0,
+        file_reference=b"",
+    )
+    setattr(file_id, "file_size", size)
+    setattr(file_id, "mime_type", "video/mp4")
+    setattr(file_id, "file_name", f"bench_{media_id}.mp4")
+    setattr(file_id, "unique_id", unique_id(media_id))
+    return file_id
+
+
+def unique_id(media_id: int) -> str:
+    return f"bn{media_id:04d}AgADbench"
+
+
+def plan_requests(args, files):
+    """Returns (message id, first byte, last byte or None) for every request."""
+    rnd = random.Random(args.seed)
+    plan = []
+    for i in range(args.requests):
+        msg_id, size = rnd.choice(files)
+        mode = args.mode
+        if mode == "mixed":
+            mode = "range" if i % 4 else "full"
+        if mode == "full":
+            plan.append((msg_id, 0, None))
+        else:
+            start = rnd.randrange(size)
+            end = min(size - 1, start + rnd.randrange(1, args.range_mb * MB))
+            plan.append((msg_id, start, end))
+    return plan
+
+
+async def fetch(session, base, msg_id, start, end, results):
+    headers = {}
+    if end is not None:
+        headers["Range"] = f"bytes={start}-{end}"
+    sent = time.perf_counter()
+    ttfb = None
+    received = 0
+    ok = True
+    position = start
+    try:
+        async with session.get(
+            f"{base}/{unique_id(msg_id)[:6]}{msg_id}", headers=headers
+        ) as resp:
+            ok = resp.status == (206 if end is not None else 200)
+            async for data in resp.content.iter_any():
+                if ttfb is None:
+                    ttfb = time.perf_counter() - sent
+                while data:
+                    piece = data[: MB - position % MB]
+                    if piece != synthetic(position, len(piece)):
+                        ok = False
+                    position += len(piece)
+                    received += len(piece)
+                    data = data[len(piece) :]
+            expected = resp.headers.get("Content-Length")
+            if expected is not None and int(expected) != received:
+                ok = False
+    except (aiohttp.ClientError, asyncio.TimeoutError):
+        ok = False
+    results.append(
+        {
+            "ok": ok,
+            "bytes": received,
+            "ttfb": ttfb if ttfb is not None else time.perf_counter() - sent,
+            "total": time.perf_counter() - sent,
+        }
+    )
+
+
+async def sample_memory(process, peak, stop):
+    while not stop.is_set():
+        peak[0] = max(peak[0], process.memory_info().rss)
+        await asyncio.sleep(0.05)
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * pct / 100))]
+
+
+async def run(args):
+    file_sizes = {}
+    files = []
+    for i in range(args.files):
+        msg_id = 1000 + i
+        size = int(args.size_mb * MB) - random.Random(i).randrange(MB)
+        file_sizes[msg_id] = size
+        files.append((msg_id, size))
+
+    sessions = []
+    multi_clients.clear()
+    work_loads.clear()
+    for index in range(args.clients):
+        session = FakeMediaSession(
+            file_sizes,
+            args.latency_ms / 1000,
+            args.jitter_ms / 1000,
+            args.dc_mbps * MB,
+            args.error_rate,
+            args.flood_rate,
+        )
+        client = FakeClient(session)
+        streamer = get_streamer(client)
+        for msg_id, size in files:
+            streamer.cached_file_ids[msg_id] = make_file_id(msg_id, size)
+        multi_clients[index] = client
+        work_loads[index] = 0
+        sessions.append(session)
+
+    runner = web.AppRunner(await web_server())
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    base = f"http://127.0.0.1:{port}"
+
+    process = psutil.Process()
+    baseline = process.memory_info().rss
+    peak = [baseline]
+    stop = asyncio.Event()
+    sampler = asyncio.create_task(sample_memory(process, peak, stop))
+
+    results = []
+    semaphore = asyncio.Semaphore(args.concurrency)
+    connector = aiohttp.TCPConnector(limit=0)
+    timeout = aiohttp.ClientTimeout(sock_read=30)
+
+    async def worker(item):
+        async with semaphore:
+            await fetch(http, base, *item, results)
+
+    started = time.perf_counter()
+    async with aiohttp.ClientSession(connector=connector, timeout=timeout) as http:
+        await asyncio.gather(*[worker(item) for item in plan_requests(args, files)])
+    elapsed = time.perf_counter() - started
+
+    stop.set()
+    await sampler
+    await runner.cleanup()
+
+    total_bytes = sum(r["bytes"] for r in results)
+    ttfbs = [r["ttfb"] * 1000 for r in results]
+    totals = [r["total"] * 1000 for r in results]
+    failed = sum(not r["ok"] for r in results)
+    print(f"mode={args.mode} clients={args.clients} concurrency={args.concurrency}")
+    print(f"requests          {len(results)} ({failed} failed or short)")
+    print(f"bytes served      {total_bytes / MB:.1f} MB in {elapsed:.2f} s")
+    print(f"throughput        {total_bytes / MB / elapsed:.1f} MB/s")
+    print(
+        f"ttfb ms           p50 {statistics.median(ttfbs):.1f}  p99 {percentile(ttfbs, 99):.1f}"
+    )
+    print(
+        f"latency ms        p50 {statistics.median(totals):.1f}  p99 {percentile(totals, 99):.1f}"
+    )
+    print(
+        f"memory per stream {(peak[0] - baseline) / args.concurrency / 1024:.0f} KiB"
+        f" (peak rss +{(peak[0] - baseline) / MB:.1f} MB)"
+    )
+    print(
+        f"GetFile calls     {sum(s.requests for s in sessions)}"
+        f" ({sum(s.rejected for s in sessions)} rejected as misaligned)"
+    )
+    return failed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--mode", choices=["full", "range", "mixed"], default="mixed")
+    parser.add_argument("--clients", type=int, default=2)
+    parser.add_argument("--files", type=int, default=4)
+    parser.add_argument("--size-mb", type=float, default=16)
+    parser.add_argument("--range-mb", type=int, default=4)
+    parser.add_argument("--requests", type=int, default=64)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--latency-ms", type=float, default=50)
+    parser.add_argument("--jitter-ms", type=float, default=20)
+    parser.add_argument("--dc-mbps", type=float, default=8)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--flood-rate", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+    failed = asyncio.run(run(args))
+    sys.exit(1 if failed and not (args.error_rate or args.flood_rate) else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -5,9 +5,13 @@ from pathlib import Path
 from pyrogram import idle
 import logging
 import logging.config
+import multiprocessing
 
 # Get logging configurations
-logging.config.fileConfig("logging.conf")
+# Spawned stream workers import this again, only the main process may open
+# the log file, which truncates it.
+if multiprocessing.parent_process() is None:
+    logging.config.fileConfig("logging.conf")
 logging.getLogger().setLevel(logging.INFO)
 logging.getLogger("pyrogram").setLevel(logging.ERROR)
 logging.getLogger("imdbpy").setLevel(logging.ERROR)
@@ -20,10 +24,11 @@ logging.getLogger("aiohttp.web").setLevel(logging.ERROR)
 
 from pyrogram import __version__
 from pyrogram.raw.all import layer
-from database.ia_filterdb import Media
 from database.users_chats_db import db
+from database.config_db import mdb
+from database.indexes import ensure_indexes
 from info import *
-from utils import temp
+from utils import temp, watch_settings
 from Script import script
 from datetime import date, datetime
 import pytz
@@ -34,10 +39,11 @@ import asyncio
 from Jisshu.bot import JisshuBot
 from Jisshu.util.keepalive import ping_server
 from Jisshu.bot.clients import initialize_clients
+from Jisshu.server.workers import start_workers
+from Jisshu.util.scheduler import delete_scheduler
 
 ppath = "plugins/*.py"
 files = glob.glob(ppath)
-JisshuBot.start()
 loop = asyncio.get_event_loop()
 
 pyrogram.utils.MIN_CHANNEL_ID = -1009147483647
@@ -65,7 +71,8 @@ async def Jisshu_start():
     b_users, b_chats = await db.get_banned()
     temp.BANNED_USERS = b_users
     temp.BANNED_CHATS = b_chats
-    await Media.ensure_indexes()
+    temp.JOIN_REQS = await db.get_join_reqs()
+    asyncio.create_task(ensure_indexes())
     me = await JisshuBot.get_me()
     temp.ME = me.id
     temp.U_NAME = me.username
@@ -73,6 +80,10 @@ async def Jisshu_start():
     temp.B_LINK = me.mention
     JisshuBot.username = "@" + me.username
     JisshuBot.loop.create_task(check_expired_premium(JisshuBot))
+    await delete_scheduler.start(JisshuBot)
+    JisshuBot.loop.create_task(mdb.run_top_messages_flusher())
+    if SETTINGS_WATCH:
+        JisshuBot.loop.create_task(watch_settings())
     logging.info(
         f"{me.first_name} with for Pyrogram v{__version__} (Layer {layer}) started on {me.username}."
     )
@@ -87,14 +98,19 @@ async def Jisshu_start():
     await JisshuBot.send_message(
         chat_id=SUPPORT_GROUP, text=f"<b>{me.mention} ʀᴇsᴛᴀʀᴛᴇᴅ 🤖</b>"
     )
-    app = web.AppRunner(await web_server())
-    await app.setup()
-    bind_address = "0.0.0.0"
-    await web.TCPSite(app, bind_address, PORT).start()
+    if STREAM_WORKERS:
+        await start_workers(STREAM_WORKERS, temp.U_NAME)
+    else:
+        app = web.AppRunner(await web_server())
+        await app.setup()
+        bind_address = "0.0.0.0"
+        await web.TCPSite(app, bind_address, PORT).start()
     await idle()
 
 
 if __name__ == "__main__":
+    # Started here so that stream workers, which import this module, don't log in.
+    JisshuBot.start()
     try:
         loop.run_until_complete(Jisshu_start())
     except KeyboardInterrupt:
@@ -1,43 +1,92 @@
+import time
+import asyncio
+import logging
+from collections import Counter
 from motor.motor_asyncio import AsyncIOMotorClient
-from info import DATABASE_URI
-from datetime import datetime
+from pymongo import UpdateOne
+from info import (
+    DATABASE_URI,
+    TOP_MESSAGES_FLUSH_INTERVAL,
+    TOP_MESSAGES_REFRESH_INTERVAL,
+    TRENDS_WINDOW_DAYS,
+)
+from Jisshu.util.metrics import mongo_listener
+from datetime import datetime, timedelta
+
+# Searches kept in the precomputed most searches list.
+TOP_MESSAGES_SIZE = 100
+
+logger = logging.getLogger(__name__)
 
 
 class Database:
     def __init__(self, uri, db_name):
-        self.client = AsyncIOMotorClient(uri)
+        self.client = AsyncIOMotorClient(uri, event_listeners=[mongo_listener])
         self.db = self.client[db_name]
         self.col = self.db.user
         self.config_col = self.db.configuration
-
-    async def update_top_messages(self, user_id, message_text):
-        user = await self.col.find_one(
-            {"user_id": user_id, "messages.text": message_text}
+        # One {q, day, count} document per search text and UTC day.
+        self.trends = self.db.search_trends
+        # text -> searches not written to the database yet
+        self.pending_messages = Counter()
+        self.top_messages = None
+
+    async def update_top_messages(self, message_text):
+        # Only counted here, flush_top_messages() writes them in the background.
+        self.pending_messages[message_text] += 1
+
+    async def flush_top_messages(self):
+        pending, self.pending_messages = self.pending_messages, Counter()
+        if not pending:
+            return
+        day = datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
+        await self.trends.bulk_write(
+            [
+                UpdateOne(
+                    {"q": text, "day": day}, {"$inc": {"count": count}}, upsert=True
+                )
+                for text, count in pending.items()
+            ],
+            ordered=False,
         )
 
-        if not user:
-            await self.col.update_one(
-                {"user_id": user_id},
-                {"$push": {"messages": {"text": message_text, "count": 1}}},
-                upsert=True,
-            )
-        else:
-            await self.col.update_one(
-                {"user_id": user_id, "messages.text": message_text},
-                {"$inc": {"messages.$.count": 1}},
-            )
-
-    async def get_top_messages(self, limit=30):
+    async def refresh_top_messages(self):
+        since = datetime.utcnow() - timedelta(days=TRENDS_WINDOW_DAYS)
         pipeline = [
-            {"$unwind": "$messages"},
-            {"$group": {"_id": "$messages.text", "count": {"$sum": "$messages.count"}}},
+            {"$match": {"day": {"$gte": since}}},
+            {"$group": {"_id": "$q", "count": {"$sum": "$count"}}},
             {"$sort": {"count": -1}},
-            {"$limit": limit},
+            {"$limit": TOP_MESSAGES_SIZE},
         ]
-        results = await self.col.aggregate(pipeline).to_list(limit)
-        return [result["_id"] for result in results]
+        results = await self.trends.aggregate(pipeline).to_list(TOP_MESSAGES_SIZE)
+        self.top_messages = [result["_id"] for result in results]
+
+    async def run_top_messages_flusher(self):
+        refreshed = None
+        while True:
+            await asyncio.sleep(TOP_MESSAGES_FLUSH_INTERVAL)
+            try:
+                await self.flush_top_messages()
+                if (
+                    refreshed is None
+                    or time.monotonic() - refreshed >= TOP_MESSAGES_REFRESH_INTERVAL
+                ):
+                    await self.refresh_top_messages()
+                    refreshed = time.monotonic()
+            except Exception as e:
+                # Analytics only, losing one interval is better than slowing searches.
+                logger.warning(f"Could not save search analytics: {e}")
+
+    async def get_top_messages(self, limit=30):
+        if self.top_messages is None:
+            await self.refresh_top_messages()
+        return self.top_messages[:limit]
 
     async def delete_all_messages(self):
+        self.pending_messages.clear()
+        self.top_messages = []
+        await self.trends.delete_many({})
+        # Per-user message arrays kept before search_trends existed.
         await self.col.delete_many({})
 
     def create_configuration_data(self, advertisement=None):
@@ -6,9 +6,10 @@ from pymongo.errors import DuplicateKeyError
 from umongo import Instance, Document, fields
 from motor.motor_asyncio import AsyncIOMotorClient
 from marshmallow.exceptions import ValidationError
+from Jisshu.util.metrics import mongo_listener
 from info import FILES_DATABASE, DATABASE_NAME, COLLECTION_NAME, MAX_BTN
 
-client = AsyncIOMotorClient(FILES_DATABASE)
+client = AsyncIOMotorClient(FILES_DATABASE, event_listeners=[mongo_listener])
 mydb = client[DATABASE_NAME]
 instance = Instance.from_db(mydb)
 
@@ -118,6 +119,17 @@ async def get_bad_files(query, file_type=None, offset=0, filter=False):
     return files, total_results
 
 
+async def delete_files(file_ids, batch_size=1000):
+    """Deletes files by id with one delete_many per batch, yields the running total."""
+    deleted = 0
+    for i in range(0, len(file_ids), batch_size):
+        result = await Media.collection.delete_many(
+            {"_id": {"$in": file_ids[i : i + batch_size]}}
+        )
+        deleted += result.deleted_count
+        yield deleted
+
+
 async def get_file_details(query):
     filter = {"file_id": query}
     cursor = Media.find(filter)
@@ -0,0 +1,28 @@
+import datetime
+from motor.motor_asyncio import AsyncIOMotorClient
+from info import DATABASE_URI, DATABASE_NAME
+from Jisshu.util.metrics import mongo_listener
+
+
+class ImdbCache:
+    def __init__(self, uri, db_name):
+        self.client = AsyncIOMotorClient(uri, event_listeners=[mongo_listener])
+        self.db = self.client[db_name]
+        self.col = self.db.imdb_cache
+
+    async def get(self, key):
+        """Returns (found, value), value may be None for a cached empty lookup."""
+        doc = await self.col.find_one({"_id": key})
+        if not doc:
+            return False, None
+        return True, doc.get("value")
+
+    async def set(self, key, value):
+        await self.col.update_one(
+            {"_id": key},
+            {"$set": {"value": value, "created_at": datetime.datetime.utcnow()}},
+            upsert=True,
+        )
+
+
+imdb_db = ImdbCache(DATABASE_URI, DATABASE_NAME)
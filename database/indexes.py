@@ -0,0 +1,88 @@
+import asyncio
+import logging
+from pymongo import ASCENDING, DESCENDING
+from database.users_chats_db import db, client
+from database.config_db import mdb
+from database.imdbdb import imdb_db
+from database.jsreferdb import referdb
+from database.ia_filterdb import Media
+from info import IMDB_CACHE_TTL, TRENDS_RETENTION_DAYS, VERIFY_ID_TTL
+
+logger = logging.getLogger(__name__)
+
+# Collections owned by modules that don't expose them, same client and URI.
+movie_series = client["movie_series_db"]["movie_series"]
+query_links = client["PermanentLinksDB"]["query_links"]
+
+# (collection, keys, options) for every query the bot runs on a hot path.
+INDEXES = [
+    (db.col, [("id", ASCENDING)], {}),
+    (db.col, [("ban_status.is_banned", ASCENDING)], {}),
+    (db.grp, [("id", ASCENDING)], {}),
+    (db.grp, [("chat_status.is_disabled", ASCENDING)], {}),
+    (db.misc, [("user_id", ASCENDING)], {}),
+    (db.verify_id, [("user_id", ASCENDING), ("hash", ASCENDING)], {}),
+    (
+        db.verify_id,
+        [("created_at", ASCENDING)],
+        {"expireAfterSeconds": VERIFY_ID_TTL},
+    ),
+    (db.users, [("id", ASCENDING)], {}),
+    (db.users, [("expiry_time", ASCENDING)], {}),
+    (db.req, [("id", ASCENDING)], {}),
+    (mdb.trends, [("q", ASCENDING), ("day", ASCENDING)], {"unique": True}),
+    (
+        mdb.trends,
+        [("day", ASCENDING)],
+        {"expireAfterSeconds": TRENDS_RETENTION_DAYS * 86400},
+    ),
+    (
+        imdb_db.col,
+        [("created_at", ASCENDING)],
+        {"expireAfterSeconds": IMDB_CACHE_TTL},
+    ),
+    (referdb.user_collection, [("user_id", ASCENDING)], {}),
+    (referdb.refer_collection, [("user_id", ASCENDING)], {}),
+    (movie_series, [("group_id", ASCENDING), ("search_count", DESCENDING)], {}),
+    (movie_series, [("name", ASCENDING), ("group_id", ASCENDING)], {}),
+    (query_links, [("link_id", ASCENDING)], {"unique": True}),
+    (query_links, [("created_at", ASCENDING)], {}),
+    (query_links, [("admin_id", ASCENDING)], {}),
+]
+
+
+async def ensure_index(collection, keys, options):
+    """Creates an index unless it exists, and fixes the TTL of one that does."""
+    name = "_".join(f"{field}_{direction}" for field, direction in keys)
+    existing = await collection.index_information()
+    index = existing.get(name)
+    if index is None:
+        await collection.create_index(keys, background=True, **options)
+        logger.info(f"Created index {collection.name}.{name}")
+        return
+    ttl = options.get("expireAfterSeconds")
+    if ttl is not None and index.get("expireAfterSeconds") != ttl:
+        await collection.database.command(
+            "collMod",
+            collection.name,
+            index={"keyPattern": dict(keys), "expireAfterSeconds": ttl},
+        )
+        logger.info(f"Changed TTL of {collection.name}.{name} to {ttl}s")
+
+
+async def ensure_indexes():
+    """
+    Reconciles the indexes in INDEXES with the database. Runs in the background
+    at startup, a failing index is logged and doesn't stop the others.
+    """
+    results = await asyncio.gather(
+        Media.ensure_indexes(),
+        *[ensure_index(*index) for index in INDEXES],
+        return_exceptions=True,
+    )
+    declared = [(Media.collection, "$file_name", {})] + INDEXES
+    for index, result in zip(declared, results):
+        if isinstance(result, Exception):
+            logger.warning(
+                f"Could not ensure index {index[0].name} {index[1]}: {result}"
+            )
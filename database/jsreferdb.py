@@ -1,37 +1,87 @@
-import pymongo
+from collections import OrderedDict
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import ReturnDocument
 from info import DATABASE_URI, DATABASE_NAME
 import logging
+from Jisshu.util.metrics import mongo_listener, cache_requests
 
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.ERROR)
 
-myclient = pymongo.MongoClient(DATABASE_URI)
+myclient = AsyncIOMotorClient(DATABASE_URI, event_listeners=[mongo_listener])
 mydb = myclient[DATABASE_NAME]
 
+# Users whose points are kept in memory, all writes go through UserTracker.
+POINTS_CACHE_SIZE = 10000
+
 
 class UserTracker:
     def __init__(self):
         self.user_collection = mydb["referusers"]
         self.refer_collection = mydb["refers"]
+        self.points = OrderedDict()
 
-    def add_user(self, user_id):
-        if not self.is_user_in_list(user_id):
-            self.user_collection.insert_one({"user_id": user_id})
+    async def add_user(self, user_id):
+        """Adds a referred user, returns False if they were already in the list."""
+        result = await self.user_collection.update_one(
+            {"user_id": user_id}, {"$setOnInsert": {"user_id": user_id}}, upsert=True
+        )
+        return result.upserted_id is not None
 
-    def remove_user(self, user_id):
-        self.user_collection.delete_one({"user_id": user_id})
+    async def remove_user(self, user_id):
+        await self.user_collection.delete_one({"user_id": user_id})
 
-    def is_user_in_list(self, user_id):
-        return bool(self.user_collection.find_one({"user_id": user_id}))
+    async def is_user_in_list(self, user_id):
+        return bool(await self.user_collection.find_one({"user_id": user_id}))
 
-    def add_refer_points(self, user_id: int, points: int):
-        self.refer_collection.update_one(
+    async def add_refer_points(self, user_id: int, points: int):
+        await self.refer_collection.update_one(
             {"user_id": user_id}, {"$set": {"points": points}}, upsert=True
         )
+        self.cache_points(user_id, points)
+
+    async def inc_refer_points(self, user_id: int, points: int):
+        """Atomically adds points to a user and returns their new total."""
+        user = await self.refer_collection.find_one_and_update(
+            {"user_id": user_id},
+            {"$inc": {"points": points}},
+            upsert=True,
+            return_document=ReturnDocument.AFTER,
+        )
+        self.cache_points(user_id, user["points"])
+        return user["points"]
+
+    async def redeem_refer_points(self, user_id: int, points: int):
+        """
+        Takes `points` from a user in one conditional update, returns False if
+        they don't have that many, so concurrent referrals can't both redeem.
+        """
+        user = await self.refer_collection.find_one_and_update(
+            {"user_id": user_id, "points": {"$gte": points}},
+            {"$inc": {"points": -points}},
+            return_document=ReturnDocument.AFTER,
+        )
+        if user is None:
+            return False
+        self.cache_points(user_id, user["points"])
+        return True
+
+    async def get_refer_points(self, user_id: int):
+        if user_id in self.points:
+            self.points.move_to_end(user_id)
+            cache_requests.labels("refer_points", "hit").inc()
+            return self.points[user_id]
+        cache_requests.labels("refer_points", "miss").inc()
+        user = await self.refer_collection.find_one({"user_id": user_id})
+        points = user.get("points") if user else 0
+        self.cache_points(user_id, points)
+        return points
 
-    def get_refer_points(self, user_id: int):
-        user = self.refer_collection.find_one({"user_id": user_id})
-        return user.get("points") if user else 0
+    def cache_points(self, user_id, points):
+        self.points[user_id] = points
+        self.points.move_to_end(user_id)
+        if len(self.points) > POINTS_CACHE_SIZE:
+            self.points.popitem(last=False)
 
 
 referdb = UserTracker()
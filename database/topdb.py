@@ -1,11 +1,14 @@
 from info import DATABASE_URI
+from Jisshu.util.metrics import mongo_listener
 import motor.motor_asyncio
 import uuid  # for generating unique IDs
 
 
 class JsTopDB:
     def __init__(self, db_uri):
-        self.client = motor.motor_asyncio.AsyncIOMotorClient(db_uri)
+        self.client = motor.motor_asyncio.AsyncIOMotorClient(
+            db_uri, event_listeners=[mongo_listener]
+        )
         self.db = self.client["movie_series_db"]
         self.collection = self.db["movie_series"]
 
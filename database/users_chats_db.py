@@ -1,15 +1,105 @@
+import time
+import asyncio
 import datetime
 import pytz
 from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import ReturnDocument
 
 # from info import SETTINGS, IS_PM_SEARCH, IS_SEND_MOVIE_UPDATE, PREMIUM_POINT,REF_PREMIUM,IS_VERIFY, SHORTENER_WEBSITE3, SHORTENER_API3, THREE_VERIFY_GAP, LINK_MODE, FILE_CAPTION, TUTORIAL, DATABASE_NAME, DATABASE_URI, IMDB, IMDB_TEMPLATE, PROTECT_CONTENT, AUTO_DELETE, SPELL_CHECK, AUTO_FILTER, LOG_VR_CHANNEL, SHORTENER_WEBSITE, SHORTENER_API, SHORTENER_WEBSITE2, SHORTENER_API2, TWO_VERIFY_GAP
 # from utils import get_seconds
 from info import *
+from Jisshu.util.metrics import mongo_listener
 
-client = AsyncIOMotorClient(DATABASE_URI)
+client = AsyncIOMotorClient(DATABASE_URI, event_listeners=[mongo_listener])
 mydb = client[DATABASE_NAME]
 
 
+def verified_today(past_date):
+    """True when past_date falls on the current day in IST."""
+    ist_timezone = pytz.timezone("Asia/Kolkata")
+    pastDate = past_date.astimezone(ist_timezone)
+    current_time = datetime.datetime.now(tz=ist_timezone)
+    seconds_since_midnight = (
+        current_time
+        - datetime.datetime(
+            current_time.year,
+            current_time.month,
+            current_time.day,
+            0,
+            0,
+            0,
+            tzinfo=ist_timezone,
+        )
+    ).total_seconds()
+    time_diff = current_time - pastDate
+    total_seconds = time_diff.total_seconds()
+    return total_seconds <= seconds_since_midnight
+
+
+def shortener_due(verified, previous, time):
+    """
+    True when the user verified today, more than `time` seconds ago, and hasn't
+    completed the next tier since.
+    """
+    ist_timezone = pytz.timezone("Asia/Kolkata")
+    if not verified_today(verified):
+        return False
+    time_difference = datetime.datetime.now(tz=ist_timezone) - verified.astimezone(
+        ist_timezone
+    )
+    if time_difference > datetime.timedelta(seconds=time):
+        return previous.astimezone(ist_timezone) < verified.astimezone(ist_timezone)
+    return False
+
+
+class UserContext:
+    def __init__(self, user_id, user, data, verification):
+        """
+        A user's documents for a single request, loaded together by
+        Database.get_user_context() so the access checks need no more queries.
+        attributes:
+            user: users document (None when the user never started the bot).
+            data: uersz document with premium, free trial and ads state.
+            verification: misc document with the verification timestamps.
+        """
+        self.user_id = user_id
+        self.user = user
+        self.data = data or {}
+        self.verification = verification
+
+    @property
+    def exists(self):
+        return self.user is not None
+
+    @property
+    def has_premium(self):
+        expiry_time = self.data.get("expiry_time")
+        return (
+            isinstance(expiry_time, datetime.datetime)
+            and datetime.datetime.now() <= expiry_time
+        )
+
+    def is_user_verified(self):
+        return verified_today(self.verification["last_verified"])
+
+    def user_verified(self):
+        return verified_today(self.verification["second_time_verified"])
+
+    def use_second_shortener(self, time):
+        return shortener_due(
+            self.verification["last_verified"],
+            self.verification["second_time_verified"],
+            time,
+        )
+
+    def use_third_shortener(self, time):
+        return shortener_due(
+            self.verification["second_time_verified"],
+            self.verification["third_time_verified"],
+            time,
+        )
+
+
 class Database:
     def __init__(self):
         self.col = mydb.users
@@ -23,6 +113,14 @@ class Database:
         self.jisshu_ads_link = mydb.jisshu_ads_link
         self.movies_update_channel = mydb.movies_update_channel
         self.botcol = mydb.botcol
+        self.deletions = mydb.deletions
+        # Called with (group_id, settings) whenever a group's settings are
+        # written, settings is None when only the stored copy is known.
+        self.settings_hooks = []
+        # Called with (user_id, expiry_time) whenever a premium expiry is set.
+        self.expiry_hooks = []
+        # user_id -> (expires, UserContext), dropped on every write to the user.
+        self.user_contexts = {}
 
     default = {
         "spell_check": SPELL_CHECK,
@@ -55,9 +153,10 @@ class Database:
         )
 
     async def get_settings(self, group_id):
-        chat = await self.grp.find_one({"id": int(group_id)})
+        chat = await self.grp.find_one({"id": int(group_id)}, {"settings": 1})
         if chat and "settings" in chat:
-            return chat["settings"]
+            # Keys added to default after the group was saved fall back to it.
+            return {**self.default, **chat["settings"]}
         else:
             return self.default.copy()
 
@@ -70,12 +169,60 @@ class Database:
     async def del_join_req(self):
         await self.req.drop()
 
+    async def get_join_reqs(self):
+        return {req["id"] async for req in self.req.find({}, {"id": 1})}
+
+    async def remove_join_req(self, id):
+        await self.req.delete_many({"id": id})
+
     def new_group(self, id, title):
         return dict(id=id, title=title, chat_status=dict(is_disabled=False, reason=""))
 
     async def add_user(self, id, name):
         user = self.new_user(id, name)
         await self.col.insert_one(user)
+        self.forget_user_context(id)
+
+    async def get_user_context(self, user_id):
+        """Loads the users, uersz and misc documents of a user concurrently."""
+        user_id = int(user_id)
+        cached = self.user_contexts.get(user_id)
+        if cached and cached[0] > time.monotonic():
+            return cached[1]
+        user, data, verification = await asyncio.gather(
+            self.col.find_one({"id": user_id}),
+            self.users.find_one({"id": user_id}),
+            self.misc.find_one({"user_id": user_id}),
+        )
+        if not verification:
+            verification = self.new_notcopy_user(user_id)
+            # An upsert, two first requests racing here don't insert it twice.
+            await self.misc.update_one(
+                {"user_id": user_id},
+                {"$setOnInsert": dict(verification)},
+                upsert=True,
+            )
+        ist_timezone = pytz.timezone("Asia/Kolkata")
+        # Tiers added after the document was created count as never verified.
+        verification.setdefault(
+            "second_time_verified",
+            datetime.datetime(2019, 5, 17, 0, 0, 0, tzinfo=ist_timezone),
+        )
+        verification.setdefault(
+            "third_time_verified",
+            datetime.datetime(2018, 5, 17, 0, 0, 0, tzinfo=ist_timezone),
+        )
+        context = UserContext(user_id, user, data, verification)
+        now = time.monotonic()
+        if len(self.user_contexts) > 10000:
+            self.user_contexts = {
+                k: v for k, v in self.user_contexts.items() if v[0] > now
+            }
+        self.user_contexts[user_id] = (now + USER_CONTEXT_TTL, context)
+        return context
+
+    def forget_user_context(self, user_id):
+        self.user_contexts.pop(int(user_id), None)
 
     async def update_point(self, id):
         await self.col.update_one({"id": id}, {"$inc": {"point": 100}})
@@ -110,6 +257,7 @@ class Database:
 
     async def delete_user(self, user_id):
         await self.col.delete_many({"id": int(user_id)})
+        self.forget_user_context(user_id)
 
     async def delete_chat(self, id):
         await self.grp.delete_many({"id": int(id)})
@@ -131,6 +279,22 @@ class Database:
 
     async def update_settings(self, id, settings):
         await self.grp.update_one({"id": int(id)}, {"$set": {"settings": settings}})
+        self.settings_changed(id, settings)
+
+    async def update_settings_keys(self, id, changes):
+        """Sets several settings of a group with one atomic $set."""
+        chat = await self.grp.find_one_and_update(
+            {"id": int(id)},
+            {"$set": {f"settings.{key}": value for key, value in changes.items()}},
+            projection={"settings": 1},
+            return_document=ReturnDocument.AFTER,
+        )
+        if chat:
+            self.settings_changed(id, {**self.default, **chat["settings"]})
+
+    def settings_changed(self, id, settings=None):
+        for hook in self.settings_hooks:
+            hook(int(id), settings)
 
     async def total_chat_count(self):
         count = await self.grp.count_documents({})
@@ -142,20 +306,23 @@ class Database:
     async def get_db_size(self):
         return (await mydb.command("dbstats"))["dataSize"]
 
+    def new_notcopy_user(self, user_id):
+        ist_timezone = pytz.timezone("Asia/Kolkata")
+        return {
+            "user_id": user_id,
+            "last_verified": datetime.datetime(
+                2020, 5, 17, 0, 0, 0, tzinfo=ist_timezone
+            ),
+            "second_time_verified": datetime.datetime(
+                2019, 5, 17, 0, 0, 0, tzinfo=ist_timezone
+            ),
+        }
+
     async def get_notcopy_user(self, user_id):
         user_id = int(user_id)
         user = await self.misc.find_one({"user_id": user_id})
-        ist_timezone = pytz.timezone("Asia/Kolkata")
         if not user:
-            res = {
-                "user_id": user_id,
-                "last_verified": datetime.datetime(
-                    2020, 5, 17, 0, 0, 0, tzinfo=ist_timezone
-                ),
-                "second_time_verified": datetime.datetime(
-                    2019, 5, 17, 0, 0, 0, tzinfo=ist_timezone
-                ),
-            }
+            res = self.new_notcopy_user(user_id)
             user = await self.misc.insert_one(res)
         return user
 
@@ -163,7 +330,10 @@ class Database:
         user_id = int(user_id)
         myquery = {"user_id": user_id}
         newvalues = {"$set": value}
-        return await self.misc.update_one(myquery, newvalues)
+        result = await self.misc.update_one(myquery, newvalues)
+        # Dropped after the write, a /start racing it would cache the old document.
+        self.forget_user_context(user_id)
+        return result
 
     async def is_user_verified(self, user_id):
         user = await self.get_notcopy_user(user_id)
@@ -172,24 +342,7 @@ class Database:
         except Exception:
             user = await self.get_notcopy_user(user_id)
             pastDate = user["last_verified"]
-        ist_timezone = pytz.timezone("Asia/Kolkata")
-        pastDate = pastDate.astimezone(ist_timezone)
-        current_time = datetime.datetime.now(tz=ist_timezone)
-        seconds_since_midnight = (
-            current_time
-            - datetime.datetime(
-                current_time.year,
-                current_time.month,
-                current_time.day,
-                0,
-                0,
-                0,
-                tzinfo=ist_timezone,
-            )
-        ).total_seconds()
-        time_diff = current_time - pastDate
-        total_seconds = time_diff.total_seconds()
-        return total_seconds <= seconds_since_midnight
+        return verified_today(pastDate)
 
     async def user_verified(self, user_id):
         user = await self.get_notcopy_user(user_id)
@@ -198,24 +351,7 @@ class Database:
         except Exception:
             user = await self.get_notcopy_user(user_id)
             pastDate = user["second_time_verified"]
-        ist_timezone = pytz.timezone("Asia/Kolkata")
-        pastDate = pastDate.astimezone(ist_timezone)
-        current_time = datetime.datetime.now(tz=ist_timezone)
-        seconds_since_midnight = (
-            current_time
-            - datetime.datetime(
-                current_time.year,
-                current_time.month,
-                current_time.day,
-                0,
-                0,
-                0,
-                tzinfo=ist_timezone,
-            )
-        ).total_seconds()
-        time_diff = current_time - pastDate
-        total_seconds = time_diff.total_seconds()
-        return total_seconds <= seconds_since_midnight
+        return verified_today(pastDate)
 
     async def use_second_shortener(self, user_id, time):
         user = await self.get_notcopy_user(user_id)
@@ -276,7 +412,12 @@ class Database:
         return False
 
     async def create_verify_id(self, user_id: int, hash):
-        res = {"user_id": user_id, "hash": hash, "verified": False}
+        res = {
+            "user_id": user_id,
+            "hash": hash,
+            "verified": False,
+            "created_at": datetime.datetime.utcnow(),
+        }
         return await self.verify_id.insert_one(res)
 
     async def get_verify_id_info(self, user_id: int, hash):
@@ -294,10 +435,12 @@ class Database:
     async def remove_ban(self, id):
         ban_status = dict(is_banned=False, ban_reason="")
         await self.col.update_one({"id": id}, {"$set": {"ban_status": ban_status}})
+        self.forget_user_context(id)
 
     async def ban_user(self, user_id, ban_reason="No Reason"):
         ban_status = dict(is_banned=True, ban_reason=ban_reason)
         await self.col.update_one({"id": user_id}, {"$set": {"ban_status": ban_status}})
+        self.forget_user_context(user_id)
 
     async def get_ban_status(self, id):
         default = dict(is_banned=False, ban_reason="")
@@ -310,6 +453,33 @@ class Database:
         await self.users.update_one(
             {"id": user_data["id"]}, {"$set": user_data}, upsert=True
         )
+        self.forget_user_context(user_data["id"])
+        if user_data.get("expiry_time"):
+            self.expiry_changed(user_data["id"], user_data["expiry_time"])
+
+    def expiry_changed(self, user_id, expiry_time):
+        self.forget_user_context(user_id)
+        for hook in self.expiry_hooks:
+            hook(user_id, expiry_time)
+
+    async def get_premium_expiries(self):
+        users = self.users.find(
+            {"expiry_time": {"$ne": None}}, {"id": 1, "expiry_time": 1}
+        )
+        return [(user["expiry_time"], user["id"]) async for user in users]
+
+    async def expire_premium(self, current_time):
+        """Ends every premium that ran out before current_time, returns the user ids."""
+        users = self.users.find({"expiry_time": {"$lt": current_time}}, {"id": 1})
+        user_ids = [user["id"] async for user in users]
+        if user_ids:
+            await self.users.update_many(
+                {"id": {"$in": user_ids}, "expiry_time": {"$lt": current_time}},
+                {"$set": {"expiry_time": None}},
+            )
+        for user_id in user_ids:
+            self.forget_user_context(user_id)
+        return user_ids
 
     async def get_expired(self, current_time):
         expired_users = []
@@ -354,6 +524,8 @@ class Database:
         try:
             # Assuming self.client and self.users are set up properly
             result = await self.users.update_one(filter_query, update_data)
+            if "id" in filter_query:
+                self.forget_user_context(filter_query["id"])
             return result.matched_count == 1
         except Exception as e:
             print(f"Error updating document: {e}")
@@ -392,6 +564,7 @@ class Database:
         expiry_time = datetime.datetime.now() + datetime.timedelta(seconds=seconds)
         user_data = {"id": user_id, "expiry_time": expiry_time, "has_free_trial": True}
         await self.users.update_one({"id": user_id}, {"$set": user_data}, upsert=True)
+        self.expiry_changed(user_id, expiry_time)
 
     # JISSHU BOTS
     async def jisshu_set_ads_link(self, link):
@@ -460,8 +633,22 @@ class Database:
             {}, {"$set": {"id": id}}, upsert=True
         )
 
-    async def reset_group_settings(self, id):
+    async def reset_group_settings(self, id, keys=None):
+        if keys is not None:
+            return await self.update_settings_keys(
+                id, {key: self.default[key] for key in keys}
+            )
         await self.grp.update_one({"id": int(id)}, {"$set": {"settings": self.default}})
+        self.settings_changed(id, self.default)
+
+    async def add_deletion(self, job):
+        return (await self.deletions.insert_one(job)).inserted_id
+
+    async def get_deletions(self):
+        return [job async for job in self.deletions.find({})]
+
+    async def remove_deletions(self, ids):
+        await self.deletions.delete_many({"_id": {"$in": list(ids)}})
 
 
 db = Database()
@@ -41,6 +41,8 @@ CHANNELS = [
 # ForceSub Channel & Log Channels
 AUTH_CHANNEL = int(environ.get("AUTH_CHANNEL", ""))
 AUTH_REQ_CHANNEL = int(environ.get("AUTH_REQ_CHANNEL", ""))
+SUBSCRIPTION_CACHE_TTL = int(environ.get("SUBSCRIPTION_CACHE_TTL", "600"))  # Seconds A Confirmed Member Isn't Rechecked
+SUBSCRIPTION_CACHE_SIZE = int(environ.get("SUBSCRIPTION_CACHE_SIZE", "100000"))  # Confirmed Members Kept In Memory
 LOG_CHANNEL = int(environ.get("LOG_CHANNEL", ""))
 LOG_API_CHANNEL = int(environ.get("LOG_API_CHANNEL", ""))
 LOG_VR_CHANNEL = int(environ.get("LOG_VR_CHANNEL", ""))
@@ -49,6 +51,8 @@ REDIRECT_CHANNEL = int(environ.get("REDIRECT_CHANNEL", "-1002596399051"))
 # MongoDB
 DATABASE_URI = environ.get("DATABASE_URI", "")
 DATABASE_NAME = environ.get("DATABASE_NAME", "Cluster0")
+MONGO_SLOW_MS = int(environ.get("MONGO_SLOW_MS", "200"))  # Log Queries Slower Than This, 0 = Off
+VERIFY_ID_TTL = int(environ.get("VERIFY_ID_TTL", "86400"))  # Seconds Verification Links Are Kept
 
 # Files index database url
 FILES_DATABASE = environ.get("FILES_DATABASE", "")
@@ -148,6 +152,9 @@ REACTIONS = ["👀", "😱", "🔥", "😍", "🎉", "🥰", "😇", "⚡"]
 
 # Other Funtions
 FILE_AUTO_DEL_TIMER = int(environ.get("FILE_AUTO_DEL_TIMER", "600"))
+DELIVERY_RATE = float(environ.get("DELIVERY_RATE", "3"))  # Files Per Second Sent To One Chat
+DELIVERY_BURST = int(environ.get("DELIVERY_BURST", "30"))  # Files Sent Unpaced Before DELIVERY_RATE Applies
+DELIVERY_ALBUMS = is_enabled("DELIVERY_ALBUMS", False)  # Send All Files As Albums, Drops The Stream Buttons
 AUTO_FILTER = is_enabled("AUTO_FILTER", True)
 IS_PM_SEARCH = is_enabled("IS_PM_SEARCH", False)
 IS_SEND_MOVIE_UPDATE = is_enabled(
@@ -156,13 +163,30 @@ IS_SEND_MOVIE_UPDATE = is_enabled(
 MAX_BTN = int(environ.get("MAX_BTN", "8"))
 AUTO_DELETE = is_enabled("AUTO_DELETE", True)
 DELETE_TIME = int(environ.get("DELETE_TIME", 1200))
+TOP_MESSAGES_FLUSH_INTERVAL = int(
+    environ.get("TOP_MESSAGES_FLUSH_INTERVAL", "30")
+)  # Seconds Between Writes Of Search Analytics
+TOP_MESSAGES_REFRESH_INTERVAL = int(
+    environ.get("TOP_MESSAGES_REFRESH_INTERVAL", "300")
+)  # Seconds Between Recomputing The Most Searches List
+TRENDS_WINDOW_DAYS = int(environ.get("TRENDS_WINDOW_DAYS", "7"))  # Days Counted In Most Searches
+TRENDS_RETENTION_DAYS = int(environ.get("TRENDS_RETENTION_DAYS", "30"))  # Days Search Counts Are Kept
 IMDB = is_enabled("IMDB", False)
 FILE_CAPTION = environ.get("FILE_CAPTION", f"{script.FILE_CAPTION}")
 IMDB_TEMPLATE = environ.get("IMDB_TEMPLATE", f"{script.IMDB_TEMPLATE_TXT}")
 LONG_IMDB_DESCRIPTION = is_enabled("LONG_IMDB_DESCRIPTION", False)
+IMDB_WORKERS = int(environ.get("IMDB_WORKERS", "4"))  # Threads Running Cinemagoer
+IMDB_TIMEOUT = int(environ.get("IMDB_TIMEOUT", "10"))  # Seconds Per IMDb Lookup
+IMDB_CACHE_SIZE = int(environ.get("IMDB_CACHE_SIZE", "1000"))  # Lookups Kept In Memory
+IMDB_CACHE_TTL = int(environ.get("IMDB_CACHE_TTL", "604800"))  # Seconds Kept In MongoDB
 PROTECT_CONTENT = is_enabled("PROTECT_CONTENT", False)
 SPELL_CHECK = is_enabled("SPELL_CHECK", True)
 LINK_MODE = is_enabled("LINK_MODE", True)
+SETTINGS_CACHE_TTL = int(environ.get("SETTINGS_CACHE_TTL", "300"))  # Seconds Group Settings Stay Cached
+SETTINGS_WATCH = is_enabled("SETTINGS_WATCH", False)  # Drop Cached Settings Changed By Other Instances (Needs A Replica Set)
+USER_CONTEXT_TTL = int(
+    environ.get("USER_CONTEXT_TTL", "10")
+)  # Seconds A User's Documents Are Reused
 TMDB_API_KEY = environ.get("TMDB_API_KEY", "")
 
 # Online Streaming And Download
@@ -170,12 +194,50 @@ STREAM_MODE = bool(environ.get("STREAM_MODE", True))  # Set True or Flase
 
 MULTI_CLIENT = False
 SLEEP_THRESHOLD = int(environ.get("SLEEP_THRESHOLD", "60"))
+CLIENT_SESSION_DIR = environ.get(
+    "CLIENT_SESSION_DIR", "sessions"
+)  # Where MULTI_TOKEN Sessions Are Kept Between Restarts, Empty = In Memory
+CLIENT_START_CONCURRENCY = int(environ.get("CLIENT_START_CONCURRENCY", "5"))
+CLIENT_START_RETRIES = int(environ.get("CLIENT_START_RETRIES", "3"))
+CLIENT_FLOOD_WAIT_LIMIT = int(environ.get("CLIENT_FLOOD_WAIT_LIMIT", "60"))  # Longer Waits Are Left To The Supervisor
+CLIENT_HEALTH_INTERVAL = int(environ.get("CLIENT_HEALTH_INTERVAL", "60"))
 PING_INTERVAL = int(environ.get("PING_INTERVAL", "1200"))  # 20 minutes
 if "DYNO" in environ:
     ON_HEROKU = True
 else:
     ON_HEROKU = False
 URL = environ.get("FQDN", "")
+METRICS_TOKEN = environ.get(
+    "METRICS_TOKEN", ""
+)  # Bearer Token Prometheus Sends To /metrics, Empty = /metrics Disabled
+
+STREAM_WORKERS = int(
+    environ.get("STREAM_WORKERS", "0")
+)  # Serve Streams From Separate Processes, 0 = Inside The Bot Process
+
+# Stream Admission Control
+STREAM_PER_IP_LIMIT = int(
+    environ.get("STREAM_PER_IP_LIMIT", "6")
+)  # Only Enforced On Heroku Or With TRUSTED_PROXIES Set, Behind A Proxy Every Viewer Shares Its IP
+TRUSTED_PROXIES = environ.get(
+    "TRUSTED_PROXIES", ""
+).split()  # Proxy IPs Or Networks Whose X-Forwarded-For Is Trusted, Heroku's Router Always Is
+STREAM_PER_CLIENT_LIMIT = int(
+    environ.get("STREAM_PER_CLIENT_LIMIT", "30")
+)  # Global Cap = Clients x This
+STREAM_RATE_LIMIT = int(
+    environ.get("STREAM_RATE_LIMIT", "0")
+)  # Bytes Per Second Per Connection, 0 = Unlimited
+STREAM_RETRY_AFTER = int(environ.get("STREAM_RETRY_AFTER", "10"))
+STREAM_FIRST_CHUNK = int(
+    environ.get("STREAM_FIRST_CHUNK", "65536")
+)  # Bytes Of The First Request After A Seek, Doubles Up To 1 MB
+STREAM_CACHE_SIZE = int(
+    environ.get("STREAM_CACHE_SIZE", "32")
+)  # MB Of Head/Tail Chunks Kept In Memory Per Process, 0 = Off
+STREAM_EDGE_CHUNKS = int(
+    environ.get("STREAM_EDGE_CHUNKS", "2")
+)  # 1 MB Chunks Cached At Each End Of A File
 
 # Commands
 admin_cmds = [
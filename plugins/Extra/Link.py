@@ -12,6 +12,7 @@ from pyrogram.types import InlineKeyboardMarkup, InlineKeyboardButton, Message
 from motor.motor_asyncio import AsyncIOMotorClient
 from pymongo.errors import DuplicateKeyError
 from info import ADMINS, REDIRECT_CHANNEL, DATABASE_URI
+from Jisshu.util.metrics import mongo_listener
 from utils import list_to_str
 from database.ia_filterdb import get_search_results
 from plugins.pm_filter import auto_filter
@@ -21,7 +22,7 @@ MONGO_DB_NAME = "PermanentLinksDB"
 LINKS_COLLECTION = "query_links"
 
 # MongoDB Client
-mongo_client = AsyncIOMotorClient(DATABASE_URI)
+mongo_client = AsyncIOMotorClient(DATABASE_URI, event_listeners=[mongo_listener])
 db = mongo_client[MONGO_DB_NAME]
 links_collection = db[LINKS_COLLECTION]
 
@@ -46,17 +47,6 @@ ADMIN_STATES = {}
 
 # MongoDB Helper Functions
 class LinkDatabase:
-    @staticmethod
-    async def create_indexes():
-        """Create database indexes for better performance."""
-        try:
-            await links_collection.create_index("link_id", unique=True)
-            await links_collection.create_index("created_at")
-            await links_collection.create_index("admin_id")
-            print("MongoDB indexes created successfully")
-        except Exception as e:
-            print(f"Index creation warning: {e}")
-
     @staticmethod
     async def save_link(link_data: Dict[str, Any]) -> bool:
         """Save permanent link to MongoDB."""
@@ -736,10 +726,8 @@ async def periodic_cleanup():
 
 # Database Initialization
 async def initialize_database():
-    """Initialize MongoDB database and indexes."""
+    """Initialize MongoDB database, indexes are created by database.indexes."""
     try:
-        await LinkDatabase.create_indexes()
-        
         # Test connection
         await db.command("ping")
         print("MongoDB connection successful")
@@ -1,7 +1,17 @@
 import re
 from pyrogram import Client, filters
 from pyrogram.types import ReplyKeyboardMarkup
-from database.config_db import mdb
+from database.config_db import mdb, TOP_MESSAGES_SIZE
+
+
+def cap_limit(limit):
+    """Caps a requested list length at the precomputed list, with a note if it did."""
+    if limit <= TOP_MESSAGES_SIZE:
+        return limit, ""
+    return (
+        TOP_MESSAGES_SIZE,
+        f"\n\n<i>Only the top {TOP_MESSAGES_SIZE} searches are kept.</i>",
+    )
 
 
 # most search commands
@@ -15,6 +25,7 @@ async def most(client, message):
         limit = int(message.command[1])
     except (IndexError, ValueError):
         limit = 20
+    limit, note = cap_limit(limit)
 
     top_messages = await mdb.get_top_messages(limit)
 
@@ -47,7 +58,7 @@ async def most(client, message):
     await m.edit_text("𝑃𝑙𝑒𝑎𝑠𝑒 𝑊𝑎𝑖𝑡, 𝐹𝑒𝑡𝑐ℎ𝑖𝑛𝑔 𝑀𝑜𝑠𝑡 𝑆𝑒𝑎𝑟𝑐ℎ𝑒𝑠..")
     await m.delete()
     await message.reply_text(
-        "<b>Hᴇʀᴇ ɪꜱ ᴛʜᴇ ᴍᴏꜱᴛ ꜱᴇᴀʀᴄʜᴇꜱ ʟɪꜱᴛ 👇</b>", reply_markup=reply_markup
+        "<b>Hᴇʀᴇ ɪꜱ ᴛʜᴇ ᴍᴏꜱᴛ ꜱᴇᴀʀᴄʜᴇꜱ ʟɪꜱᴛ 👇</b>" + note, reply_markup=reply_markup
     )
 
 
@@ -68,6 +79,7 @@ async def trendlist(client, message):
                 "Invalid number format.\nPlease provide a valid number after the /trendlist command."
             )
             return  # Exit the function if the argument is not a valid integer
+    limit, note = cap_limit(limit)
 
     try:
         top_messages = await mdb.get_top_messages(limit)
@@ -100,7 +112,7 @@ async def trendlist(client, message):
 
     # Append the additional message at the end
     additional_message = "𝑨𝒍𝒍 𝒕𝒉𝒆 𝒓𝒆𝒔𝒖𝒍𝒕𝒔 𝒂𝒃𝒐𝒗𝒆 𝒄𝒐𝒎𝒆 𝒇𝒓𝒐𝒎 𝒘𝒉𝒂𝒕 𝒖𝒔𝒆𝒓𝒔 𝒉𝒂𝒗𝒆 𝒔𝒆𝒂𝒓𝒄𝒉𝒆𝒅 𝒇𝒐𝒓. 𝑻𝒉𝒆𝒚'𝒓𝒆 𝒔𝒉𝒐𝒘𝒏 𝒕𝒐 𝒚𝒐𝒖 𝒆𝒙𝒂𝒄𝒕𝒍𝒚 𝒂𝒔 𝒕𝒉𝒆𝒚 𝒘𝒆𝒓𝒆 𝒔𝒆𝒂𝒓𝒄𝒉𝒆𝒅, 𝒘𝒊𝒕𝒉𝒐𝒖𝒕 𝒂𝒏𝒚 𝒄𝒉𝒂𝒏𝒈𝒆𝒔 𝒃𝒚 𝒕𝒉𝒆 𝒐𝒘𝒏𝒆𝒓."
-    formatted_list += f"\n\n{additional_message}"
+    formatted_list += f"\n\n{additional_message}{note}"
 
     reply_text = f"<b><u>Top {len(truncated_messages)} Most Searches List:</u></b>\n\n{formatted_list}"
 
@@ -1,34 +1,106 @@
 from aiohttp import web
 from .route import routes
-from asyncio import sleep
-from datetime import datetime
+from Jisshu.server.admission import admission_middleware
+import heapq
+import asyncio
+from datetime import datetime, timezone
+from pyrogram.errors import FloodWait
 from database.users_chats_db import db
+from Jisshu.util.delivery import get_bucket, send
 from info import LOG_CHANNEL
 
+# (expiry_time, user_id) of every premium user, entries can be stale since
+# the database is asked again when one falls due.
+expiries = []
+expiry_added = asyncio.Event()
+
 
 async def web_server():
-    web_app = web.Application(client_max_size=30000000)
+    web_app = web.Application(
+        client_max_size=30000000, middlewares=[admission_middleware]
+    )
     web_app.add_routes(routes)
     return web_app
 
 
+def schedule_expiry(user_id, expiry_time):
+    if expiry_time.tzinfo:
+        # Stored as UTC and read back naive, like every other expiry.
+        expiry_time = expiry_time.astimezone(timezone.utc).replace(tzinfo=None)
+    heapq.heappush(expiries, (expiry_time, user_id))
+    expiry_added.set()
+
+
+db.expiry_hooks.append(schedule_expiry)
+
+
 async def check_expired_premium(client):
+    for entry in await db.get_premium_expiries():
+        heapq.heappush(expiries, entry)
     while 1:
-        data = await db.get_expired(datetime.now())
-        for user in data:
-            user_id = user["id"]
-            await db.remove_premium_access(user_id)
+        expiry_added.clear()
+        timeout = (
+            (expiries[0][0] - datetime.now()).total_seconds() if expiries else None
+        )
+        if timeout is None or timeout > 0:
+            try:
+                await asyncio.wait_for(expiry_added.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+            continue
+        now = datetime.now()
+        try:
+            user_ids = await db.expire_premium(now)
+        except Exception as e:
+            # The due entries stay on the heap, so this is tried again.
+            print(e)
+            await asyncio.sleep(5)
+            continue
+        while expiries and expiries[0][0] <= now:
+            heapq.heappop(expiries)
+        if user_ids:
+            asyncio.create_task(notify_expired(client, user_ids))
+
+
+async def get_users(client, user_ids, retries=3):
+    """
+    Resolves user ids in one call, retrying it a few times. If it keeps failing
+    each user is looked up on its own, so one bad id doesn't drop the others.
+    """
+    for attempt in range(retries):
+        try:
+            return await client.get_users(user_ids)
+        except FloodWait as e:
+            await asyncio.sleep(e.value)
+        except Exception as e:
+            print(e)
+            await asyncio.sleep(2**attempt)
+    users = []
+    for user_id in user_ids:
+        try:
+            users.append(await client.get_users(user_id))
+        except Exception as e:
+            print(f"Couldn't get user {user_id}: {e}")
+    return users
+
+
+async def notify_expired(client, user_ids):
+    log_bucket = get_bucket(LOG_CHANNEL)
+    for i in range(0, len(user_ids), 200):
+        users = await get_users(client, user_ids[i : i + 200])
+        for user in users:
             try:
-                user = await client.get_users(user_id)
-                await client.send_message(
-                    chat_id=user_id,
+                await send(
+                    get_bucket(user.id),
+                    client.send_message,
+                    chat_id=user.id,
                     text=f"<b>ʜᴇʏ {user.mention},\n\nʏᴏᴜʀ ᴘʀᴇᴍɪᴜᴍ ᴀᴄᴄᴇss ʜᴀs ᴇxᴘɪʀᴇᴅ, ᴛʜᴀɴᴋ ʏᴏᴜ ꜰᴏʀ ᴜsɪɴɢ ᴏᴜʀ sᴇʀᴠɪᴄᴇ 😊\n\nɪꜰ ʏᴏᴜ ᴡᴀɴᴛ ᴛᴏ ᴛᴀᴋᴇ ᴛʜᴇ ᴘʀᴇᴍɪᴜᴍ ᴀɢᴀɪɴ, ᴛʜᴇɴ ᴄʟɪᴄᴋ ᴏɴ ᴛʜᴇ /plan ꜰᴏʀ ᴛʜᴇ ᴅᴇᴛᴀɪʟs ᴏꜰ ᴛʜᴇ ᴘʟᴀɴs...</b>",
                 )
-                await client.send_message(
+                await send(
+                    log_bucket,
+                    client.send_message,
                     LOG_CHANNEL,
-                    text=f"<b>#Premium_Expire\n\nUser name: {user.mention}\nUser id: <code>{user_id}</code>",
+                    text=f"<b>#Premium_Expire\n\nUser name: {user.mention}\nUser id: <code>{user.id}</code>",
                 )
             except Exception as e:
                 print(e)
-            await sleep(0.5)
-        await sleep(1)
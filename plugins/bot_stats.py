@@ -6,6 +6,7 @@ from database.users_chats_db import db
 from database.ia_filterdb import Media, get_files_db_size
 from utils import get_size, temp
 from Script import script
+from Jisshu.server.workers import active_streams
 import psutil
 import time
 
@@ -114,6 +115,7 @@ async def get_ststs(bot, message):
         script.STATUS_TXT.format(
             users, groups, size, free, files, db2_size, db2_free, uptime, ram, cpu
         )
+        + f"\n<b>» ᴀᴄᴛɪᴠᴇ sᴛʀᴇᴀᴍs - <code>{active_streams()}</code></b>"
     )
 
 
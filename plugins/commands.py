@@ -38,10 +38,14 @@ from utils import (
     temp,
     get_readable_time,
     save_default_settings,
+    update_group_settings,
 )
 import re
 import base64
 from info import *
+from Jisshu.util.metrics import track_handler
+from Jisshu.util.scheduler import delete_scheduler
+from Jisshu.util.delivery import send_files
 
 logger = logging.getLogger(__name__)
 movie_series_db = JsTopDB(DATABASE_URI)
@@ -49,6 +53,7 @@ verification_ids = {}
 
 
 @Client.on_message(filters.command("start") & filters.incoming)
+@track_handler
 async def start(client: Client, message):
     await message.react(emoji=random.choice(REACTIONS))
     m = message
@@ -121,9 +126,7 @@ async def start(client: Client, message):
     if message.chat.type in [enums.ChatType.GROUP, enums.ChatType.SUPERGROUP]:
         status = get_status()
         aks = await message.reply_text(f"<b>🔥 ʏᴇs {status},\nʜᴏᴡ ᴄᴀɴ ɪ ʜᴇʟᴘ ʏᴏᴜ??</b>")
-        await asyncio.sleep(600)
-        await aks.delete()
-        await m.delete()
+        await delete_scheduler.schedule(600, aks.chat.id, [aks.id, m.id])
         if not await db.get_chat(message.chat.id):
             total = await client.get_chat_members_count(message.chat.id)
             group_link = await message.chat.export_invite_link()
@@ -142,7 +145,8 @@ async def start(client: Client, message):
             )
             await db.add_chat(message.chat.id, message.chat.title)
         return
-    if not await db.is_user_exist(message.from_user.id):
+    context = await db.get_user_context(message.from_user.id)
+    if not context.exists:
         await db.add_user(message.from_user.id, message.from_user.first_name)
         await client.send_message(
             LOG_CHANNEL,
@@ -232,7 +236,7 @@ async def start(client: Client, message):
         if user_id == message.from_user.id:
             await message.reply_text("𝖧𝖾𝗒 𝖣𝗎𝖽𝖾 𝖸𝗈𝗎 𝖢𝖺𝗇'𝗍 𝖱𝖾𝖿𝖾𝗋 𝖸𝗈𝗎𝗋𝗌𝖾𝗅𝖿⁉️")
             return
-        if referdb.is_user_in_list(message.from_user.id):
+        if await referdb.is_user_in_list(message.from_user.id):
             await message.reply_text("‼️ 𝖸𝗈𝗎 𝖧𝖺𝗏𝖾 𝖡𝖾𝖾𝗇 𝖠𝗅𝗅𝗋𝖾𝖺𝖽𝗒 𝖨𝗇𝗏𝗂𝗍𝖾𝖽 𝗈𝗋 𝖩𝗈𝗂𝗇𝖾𝖽")
             return
         if await db.is_user_exist(message.from_user.id):
@@ -242,17 +246,17 @@ async def start(client: Client, message):
             uss = await client.get_users(user_id)
         except Exception:
             return
-        referdb.add_user(message.from_user.id)
-        fromuse = referdb.get_refer_points(user_id) + 10
-        if fromuse == 100:
-            referdb.add_refer_points(user_id, 0)
+        if not await referdb.add_user(message.from_user.id):
+            # Followed the same link twice at once, the other update counted it.
+            return
+        await referdb.inc_refer_points(user_id, 10)
+        if await referdb.redeem_refer_points(user_id, 100):
             await message.reply_text(f"𝖸𝗈𝗎 𝖧𝖺𝗏𝖾 𝖡𝖾𝖾𝗇 𝖨𝗇𝗏𝗂𝗍𝖾𝖽 𝖡𝗒 {uss.mention}!")
             await client.send_message(
                 user_id, text=f"𝖸𝗈𝗎 𝖧𝖺𝗏𝖾 𝖡𝖾𝖾𝗇 𝖨𝗇𝗏𝗂𝗍𝖾𝖽 𝖡𝗒 {message.from_user.mention}!"
             )
             await add_premium(client, user_id, uss)
         else:
-            referdb.add_refer_points(user_id, fromuse)
             await message.reply_text(f"𝖸𝗈𝗎 𝖧𝖺𝗏𝖾 𝖡𝖾𝖾𝗇 𝖨𝗇𝗏𝗂𝗍𝖾𝖽 𝖡𝗒 {uss.mention}!")
             await client.send_message(
                 user_id, f"𝖸𝗈𝗎 𝖧𝖺𝗏𝖾 𝖨𝗇𝗏𝗂𝗍𝖾𝖽 {message.from_user.mention}!"
@@ -376,17 +380,17 @@ async def start(client: Client, message):
             return
 
     user_id = m.from_user.id
-    if not await db.has_premium_access(user_id):
+    if not context.has_premium:
         grp_id = int(grp_id)
         print(f"Group Id - {grp_id}")
-        user_verified = await db.is_user_verified(user_id)
+        user_verified = context.is_user_verified()
         settings = await get_settings(grp_id)
         print(f"Id Settings - {settings}")
-        is_second_shortener = await db.use_second_shortener(
-            user_id, settings.get("verify_time", TWO_VERIFY_GAP)
+        is_second_shortener = context.use_second_shortener(
+            settings.get("verify_time", TWO_VERIFY_GAP)
         )
-        is_third_shortener = await db.use_third_shortener(
-            user_id, settings.get("third_verify_time", THREE_VERIFY_GAP)
+        is_third_shortener = context.use_third_shortener(
+            settings.get("third_verify_time", THREE_VERIFY_GAP)
         )
         if (
             settings.get("is_verify", IS_VERIFY)
@@ -434,7 +438,7 @@ async def start(client: Client, message):
                 ],
             ]
             reply_markup = InlineKeyboardMarkup(buttons)
-            if await db.user_verified(user_id):
+            if context.user_verified():
                 msg = script.THIRDT_VERIFICATION_TEXT
             else:
                 msg = (
@@ -448,9 +452,7 @@ async def start(client: Client, message):
                 reply_markup=reply_markup,
                 parse_mode=enums.ParseMode.HTML,
             )
-            await asyncio.sleep(300)
-            await d.delete()
-            await m.delete()
+            await delete_scheduler.schedule(300, d.chat.id, [d.id, m.id])
             return
 
     if data and data.startswith("allfiles"):
@@ -459,12 +461,12 @@ async def start(client: Client, message):
         if not files:
             await message.reply_text("<b>⚠️ ᴀʟʟ ꜰɪʟᴇs ɴᴏᴛ ꜰᴏᴜɴᴅ ⚠️</b>")
             return
-        files_to_delete = []
+        user_id = message.from_user.id
+        grp_id = temp.CHAT.get(user_id)
+        settings = await get_settings(grp_id)
+        CAPTION = settings["caption"]
+        deliveries = []
         for file in files:
-            user_id = message.from_user.id
-            grp_id = temp.CHAT.get(user_id)
-            settings = await get_settings(grp_id)
-            CAPTION = settings["caption"]
             f_caption = CAPTION.format(
                 file_name=formate_file_name(file.file_name),
                 file_size=get_size(file.file_size),
@@ -477,13 +479,8 @@ async def start(client: Client, message):
                     )
                 ]
             ]
-            toDel = await client.send_cached_media(
-                chat_id=message.from_user.id,
-                file_id=file.file_id,
-                caption=f_caption,
-                reply_markup=InlineKeyboardMarkup(btn),
-            )
-            files_to_delete.append(toDel)
+            deliveries.append((file, f_caption, InlineKeyboardMarkup(btn)))
+        files_to_delete = await send_files(client, user_id, deliveries)
 
         delCap = "<i>ᴀʟʟ {} ꜰɪʟᴇꜱ ᴡɪʟʟ ʙᴇ ᴅᴇʟᴇᴛᴇᴅ ᴀꜰᴛᴇʀ {} ᴛᴏ ᴀᴠᴏɪᴅ ᴄᴏᴘʏʀɪɢʜᴛ ᴠɪᴏʟᴀᴛɪᴏɴs!</i>".format(
             len(files_to_delete),
@@ -502,13 +499,11 @@ async def start(client: Client, message):
             ),
         )
         replyed = await message.reply(delCap)
-        await asyncio.sleep(FILE_AUTO_DEL_TIMER)
-        for file in files_to_delete:
-            try:
-                await file.delete()
-            except:
-                pass
-        return await replyed.edit(
+        return await delete_scheduler.schedule(
+            FILE_AUTO_DEL_TIMER,
+            replyed.chat.id,
+            [file.id for file in files_to_delete],
+            replyed.id,
             afterDelCap,
         )
     if not data:
@@ -554,9 +549,9 @@ async def start(client: Client, message):
         )
     )
     replyed = await message.reply(delCap, reply_to_message_id=toDel.id)
-    await asyncio.sleep(FILE_AUTO_DEL_TIMER)
-    await toDel.delete()
-    return await replyed.edit(afterDelCap)
+    return await delete_scheduler.schedule(
+        FILE_AUTO_DEL_TIMER, toDel.chat.id, [toDel.id], replyed.id, afterDelCap
+    )
 
 
 @Client.on_message(filters.command("delete"))
@@ -1025,8 +1020,7 @@ async def set_shortner(c, m):
         ).json()
         if resp["status"] == "success":
             SHORT_LINK = resp["shortenedUrl"]
-        await save_group_settings(grp_id, "shortner", URL)
-        await save_group_settings(grp_id, "api", API)
+        await update_group_settings(grp_id, {"shortner": URL, "api": API})
         await m.reply_text(
             f"<b><u>✓ sᴜᴄᴄᴇssꜰᴜʟʟʏ ʏᴏᴜʀ sʜᴏʀᴛɴᴇʀ ɪs ᴀᴅᴅᴇᴅ</u>\n\nᴅᴇᴍᴏ - {SHORT_LINK}\n\nsɪᴛᴇ - `{URL}`\n\nᴀᴘɪ - `{API}`</b>",
             quote=True,
@@ -1044,8 +1038,7 @@ async def set_shortner(c, m):
             LOG_API_CHANNEL, log_message, disable_web_page_preview=True
         )
     except Exception as e:
-        await save_group_settings(grp_id, "shortner", SHORTENER_WEBSITE)
-        await save_group_settings(grp_id, "api", SHORTENER_API)
+        await save_default_settings(grp_id, ["shortner", "api"])
         await m.reply_text(
             f"<b><u>💢 ᴇʀʀᴏʀ ᴏᴄᴄᴏᴜʀᴇᴅ!!</u>\n\nᴀᴜᴛᴏ ᴀᴅᴅᴇᴅ ʙᴏᴛ ᴏᴡɴᴇʀ ᴅᴇꜰᴜʟᴛ sʜᴏʀᴛɴᴇʀ\n\nɪꜰ ʏᴏᴜ ᴡᴀɴᴛ ᴛᴏ ᴄʜᴀɴɢᴇ ᴛʜᴇɴ ᴜsᴇ ᴄᴏʀʀᴇᴄᴛ ꜰᴏʀᴍᴀᴛ ᴏʀ ᴀᴅᴅ ᴠᴀʟɪᴅ sʜᴏʀᴛʟɪɴᴋ ᴅᴏᴍᴀɪɴ ɴᴀᴍᴇ & ᴀᴘɪ\n\nʏᴏᴜ ᴄᴀɴ ᴀʟsᴏ ᴄᴏɴᴛᴀᴄᴛ ᴏᴜʀ <a href=https://telegram.me/+JWsoDEJEB9EyNDU1>sᴜᴘᴘᴏʀᴛ ɢʀᴏᴜᴘ</a> ꜰᴏʀ sᴏʟᴠᴇ ᴛʜɪs ɪssᴜᴇ...\n\nʟɪᴋᴇ -\n\n`/set_shortner mdiskshortner.link e7beb3c8f756dfa15d0bec495abc65f58c0dfa95`\n\n💔 ᴇʀʀᴏʀ - <code>{e}</code></b>",
             quote=True,
@@ -1076,8 +1069,7 @@ async def set_shortner_2(c, m):
         ).json()
         if resp["status"] == "success":
             SHORT_LINK = resp["shortenedUrl"]
-        await save_group_settings(grp_id, "shortner_two", URL)
-        await save_group_settings(grp_id, "api_two", API)
+        await update_group_settings(grp_id, {"shortner_two": URL, "api_two": API})
         await m.reply_text(
             f"<b><u>✅ sᴜᴄᴄᴇssꜰᴜʟʟʏ ʏᴏᴜʀ sʜᴏʀᴛɴᴇʀ ɪs ᴀᴅᴅᴇᴅ</u>\n\nᴅᴇᴍᴏ - {SHORT_LINK}\n\nsɪᴛᴇ - `{URL}`\n\nᴀᴘɪ - `{API}`</b>",
             quote=True,
@@ -1095,8 +1087,7 @@ async def set_shortner_2(c, m):
             LOG_API_CHANNEL, log_message, disable_web_page_preview=True
         )
     except Exception as e:
-        await save_group_settings(grp_id, "shortner_two", SHORTENER_WEBSITE2)
-        await save_group_settings(grp_id, "api_two", SHORTENER_API2)
+        await save_default_settings(grp_id, ["shortner_two", "api_two"])
         await m.reply_text(
             f"<b><u>💢 ᴇʀʀᴏʀ ᴏᴄᴄᴏᴜʀᴇᴅ!!</u>\n\nᴀᴜᴛᴏ ᴀᴅᴅᴇᴅ ʙᴏᴛ ᴏᴡɴᴇʀ ᴅᴇꜰᴜʟᴛ sʜᴏʀᴛɴᴇʀ\n\nɪꜰ ʏᴏᴜ ᴡᴀɴᴛ ᴛᴏ ᴄʜᴀɴɢᴇ ᴛʜᴇɴ ᴜsᴇ ᴄᴏʀʀᴇᴄᴛ ꜰᴏʀᴍᴀᴛ ᴏʀ ᴀᴅᴅ ᴠᴀʟɪᴅ sʜᴏʀᴛʟɪɴᴋ ᴅᴏᴍᴀɪɴ ɴᴀᴍᴇ & ᴀᴘɪ\n\nʏᴏᴜ ᴄᴀɴ ᴀʟsᴏ ᴄᴏɴᴛᴀᴄᴛ ᴏᴜʀ <a href=https://telegram.me/+JWsoDEJEB9EyNDU1>sᴜᴘᴘᴏʀᴛ ɢʀᴏᴜᴘ</a> ꜰᴏʀ sᴏʟᴠᴇ ᴛʜɪs ɪssᴜᴇ...\n\nʟɪᴋᴇ -\n\n`/set_shortner_2 mdiskshortner.link e7beb3c8f756dfa15d0bec495abc65f58c0dfa95`\n\n💔 ᴇʀʀᴏʀ - <code>{e}</code></b>",
             quote=True,
@@ -1137,8 +1128,7 @@ async def set_shortner_3(c, m):
         ).json()
         if resp["status"] == "success":
             SHORT_LINK = resp["shortenedUrl"]
-        await save_group_settings(grp_id, "shortner_three", URL)
-        await save_group_settings(grp_id, "api_three", API)
+        await update_group_settings(grp_id, {"shortner_three": URL, "api_three": API})
         await m.reply_text(
             f"<b><u>✅ sᴜᴄᴄᴇssꜰᴜʟʟʏ ʏᴏᴜʀ sʜᴏʀᴛɴᴇʀ ɪs ᴀᴅᴅᴇᴅ</u>\n\nᴅᴇᴍᴏ - {SHORT_LINK}\n\nsɪᴛᴇ - `{URL}`\n\nᴀᴘɪ - `{API}`</b>",
             quote=True,
@@ -1155,8 +1145,7 @@ async def set_shortner_3(c, m):
             LOG_API_CHANNEL, log_message, disable_web_page_preview=True
         )
     except Exception as e:
-        await save_group_settings(grp_id, "shortner_three", SHORTENER_WEBSITE3)
-        await save_group_settings(grp_id, "api_three", SHORTENER_API3)
+        await save_default_settings(grp_id, ["shortner_three", "api_three"])
         await m.reply_text(
             f"<b><u>💢 ᴇʀʀᴏʀ ᴏᴄᴄᴏᴜʀᴇᴅ!!</u>\n\nᴀᴜᴛᴏ ᴀᴅᴅᴇᴅ ʙᴏᴛ ᴏᴡɴᴇʀ ᴅᴇꜰᴜʟᴛ sʜᴏʀᴛɴᴇʀ\n\nɪꜰ ʏᴏᴜ ᴡᴀɴᴛ ᴛᴏ ᴄʜᴀɴɢᴇ ᴛʜᴇɴ ᴜsᴇ ᴄᴏʀʀᴇᴄᴛ ꜰᴏʀᴍᴀᴛ ᴏʀ ᴀᴅᴅ ᴠᴀʟɪᴅ sʜᴏʀᴛʟɪɴᴋ ᴅᴏᴍᴀɪɴ ɴᴀᴍᴇ & ᴀᴘɪ\n\nʏᴏᴜ ᴄᴀɴ ᴀʟsᴏ ᴄᴏɴᴛᴀᴄᴛ ᴏᴜʀ <a href=https://telegram.me/+JWsoDEJEB9EyNDU1>sᴜᴘᴘᴏʀᴛ ɢʀᴏᴜᴘ</a> ꜰᴏʀ sᴏʟᴠᴇ ᴛʜɪs ɪssᴜᴇ...\n\nʟɪᴋᴇ -\n\n`/set_shortner_3 mdiskshortner.link e7beb3c8f756dfa15d0bec495abc65f58c0dfa95`\n\n💔 ᴇʀʀᴏʀ - <code>{e}</code></b>",
             quote=True,
@@ -1263,8 +1252,7 @@ async def all_settings(client, message):
     dlt = await message.reply_text(
         text, reply_markup=reply_markup, disable_web_page_preview=True
     )
-    await asyncio.sleep(300)
-    await dlt.delete()
+    await delete_scheduler.schedule(300, dlt.chat.id, [dlt.id])
 
 
 @Client.on_message(filters.command("set_time_2"))
@@ -1373,7 +1361,7 @@ async def refer(bot, message):
                 url=f"https://telegram.me/share/url?url=https://telegram.dog/{bot.me.username}?start=reff_{message.from_user.id}&text=Hello%21%20Experience%20a%20bot%20that%20offers%20a%20vast%20library%20of%20unlimited%20movies%20and%20series.%20%F0%9F%98%83",
             ),
             InlineKeyboardButton(
-                f"⏳ {referdb.get_refer_points(message.from_user.id)}",
+                f"⏳ {await referdb.get_refer_points(message.from_user.id)}",
                 callback_data="ref_point",
             ),
             InlineKeyboardButton("• ᴄʟᴏsᴇ •", callback_data="close_data"),
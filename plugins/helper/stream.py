@@ -7,6 +7,7 @@ from info import URL, LOG_CHANNEL
 from urllib.parse import quote_plus
 from Jisshu.util.file_properties import get_name, get_hash, get_media_file_size
 from Jisshu.util.human_readable import humanbytes
+from Jisshu.util.custom_dl import warm_file
 import humanize
 
 
@@ -30,6 +31,7 @@ async def stream_start(client, message):
             chat_id=LOG_CHANNEL,
             file_id=fileid,
         )
+        warm_file(log_msg.id)
         fileName = {quote_plus(get_name(log_msg))}
         stream = f"{URL}watch/{str(log_msg.id)}?hash={get_hash(log_msg)}"
         download = f"{URL}{str(log_msg.id)}?hash={get_hash(log_msg)}"
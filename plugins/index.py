@@ -5,6 +5,7 @@ from info import ADMINS, CHANNELS
 from database.ia_filterdb import save_file
 from pyrogram.types import InlineKeyboardMarkup, InlineKeyboardButton
 from utils import temp, get_readable_time
+from Jisshu.util.metrics import flood_waits
 import time
 
 lock = asyncio.Lock()
@@ -160,6 +161,7 @@ async def index_files_to_db(lst_msg_id, chat, msg, bot, skip):
                 elif sts == "err":
                     errors += 1
         except FloodWait as e:
+            flood_waits.labels("get_messages").inc()
             await asyncio.sleep(e.x)
         except Exception as e:
             await msg.reply(f"Index canceled due to Error - {e}")
@@ -1,16 +1,41 @@
-from pyrogram import Client, filters
-from pyrogram.types import ChatJoinRequest
+from pyrogram import Client, filters, enums
+from pyrogram.types import ChatJoinRequest, ChatMemberUpdated
 from database.users_chats_db import db
 from info import ADMINS, AUTH_CHANNEL
+from utils import temp, cache_subscription
+
+# Only the force subscribe channels, not every chat the bot is a member of.
+fsub_channels = filters.create(
+    lambda _, __, update: update.chat.id in temp.FSUB_CHANNELS
+)
 
 
 @Client.on_chat_join_request(filters.chat(AUTH_CHANNEL))
 async def join_reqs(client, message: ChatJoinRequest):
-    if not await db.find_join_req(message.from_user.id):
+    if message.from_user.id not in temp.JOIN_REQS:
+        temp.JOIN_REQS.add(message.from_user.id)
         await db.add_join_req(message.from_user.id)
 
 
+@Client.on_chat_member_updated(fsub_channels)
+async def member_updates(client, update: ChatMemberUpdated):
+    member = update.new_chat_member or update.old_chat_member
+    if not member or not member.user:
+        return
+    user_id = member.user.id
+    new = update.new_chat_member
+    joined = new is not None and new.status not in (
+        enums.ChatMemberStatus.LEFT,
+        enums.ChatMemberStatus.BANNED,
+    )
+    cache_subscription(user_id, update.chat.id, joined)
+    if not joined and update.chat.id == AUTH_CHANNEL and user_id in temp.JOIN_REQS:
+        temp.JOIN_REQS.discard(user_id)
+        await db.remove_join_req(user_id)
+
+
 @Client.on_message(filters.command("delreq") & filters.private & filters.user(ADMINS))
 async def del_requests(client, message):
     await db.del_join_req()
+    temp.JOIN_REQS.clear()
     await message.reply("<b>⚙ ꜱᴜᴄᴄᴇꜱꜱғᴜʟʟʏ ᴄʜᴀɴɴᴇʟ ʟᴇғᴛ ᴜꜱᴇʀꜱ ᴅᴇʟᴇᴛᴇᴅ</b>")
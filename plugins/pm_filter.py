@@ -25,17 +25,22 @@ from utils import (
     is_check_admin,
     get_size,
     save_group_settings,
+    save_default_settings,
     get_poster,
     get_status,
     get_readable_time,
-    imdb,
+    imdb_search,
+    get_poster_photo,
+    save_poster,
     formate_file_name,
 )
 from database.users_chats_db import db
+from Jisshu.util.scheduler import delete_scheduler
 from database.ia_filterdb import (
     Media,
     get_search_results,
     get_bad_files,
+    delete_files,
 )
 import random
 
@@ -52,14 +57,17 @@ from database.config_db import mdb
 import logging
 from urllib.parse import quote_plus
 from Jisshu.util.file_properties import get_name, get_hash
+from Jisshu.util.metrics import track_handler
+from Jisshu.util.custom_dl import warm_file
 
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.ERROR)
 
 
 @Client.on_message(filters.private & filters.text & filters.incoming)
+@track_handler
 async def pm_search(client, message):
-    await mdb.update_top_messages(message.from_user.id, message.text)
+    await mdb.update_top_messages(message.text)
     bot_id = client.me.id
     user_id = message.from_user.id
     #   if user_id in ADMINS: return
@@ -87,9 +95,10 @@ async def pm_search(client, message):
 
 
 @Client.on_message(filters.group & filters.text & filters.incoming)
+@track_handler
 async def group_search(client, message):
     # await message.react(emoji=random.choice(REACTIONS))
-    await mdb.update_top_messages(message.from_user.id, message.text)
+    await mdb.update_top_messages(message.text)
     user_id = message.from_user.id if message.from_user else None
     chat_id = message.chat.id
     settings = await get_settings(chat_id)
@@ -114,8 +123,7 @@ async def group_search(client, message):
                         ]
                     ),
                 )
-                await asyncio.sleep(300)
-                return await msg.delete()
+                return await delete_scheduler.schedule(300, msg.chat.id, [msg.id])
             else:
                 return
         except Exception as e:
@@ -191,12 +199,7 @@ async def group_search(client, message):
 
     else:
         k = await message.reply_text("<b>⚠️ ᴀᴜᴛᴏ ꜰɪʟᴛᴇʀ ᴍᴏᴅᴇ ɪꜱ ᴏғғ...</b>")
-        await asyncio.sleep(10)
-        await k.delete()
-        try:
-            await message.delete()
-        except:
-            pass
+        await delete_scheduler.schedule(10, k.chat.id, [k.id, message.id])
 
 
 @Client.on_callback_query(filters.regex(r"^reffff"))
@@ -208,7 +211,7 @@ async def refercall(bot, query):
                 url=f"https://telegram.me/share/url?url=https://telegram.dog/{bot.me.username}?start=reff_{query.from_user.id}&text=Hello%21%20Experience%20a%20bot%20that%20offers%20a%20vast%20library%20of%20unlimited%20movies%20and%20series.%20%F0%9F%98%83",
             ),
             InlineKeyboardButton(
-                f"⏳ {referdb.get_refer_points(query.from_user.id)}",
+                f"⏳ {await referdb.get_refer_points(query.from_user.id)}",
                 callback_data="ref_point",
             ),
         ],
@@ -250,6 +253,7 @@ async def admin_commands(client, query):
 
 
 @Client.on_callback_query(filters.regex(r"^next"))
+@track_handler
 async def next_page(bot, query):
     ident, req, key, offset = query.data.split("_")
     if int(req) not in [query.from_user.id, 0]:
@@ -1145,6 +1149,8 @@ async def advantage_spoll_choker(bot, query):
     if int(user) != 0 and query.from_user.id != int(user):
         return await query.answer(script.ALRT_TXT, show_alert=True)
     movie = await get_poster(id, id=True)
+    if not movie:
+        return await query.answer("IMDb is not responding, try again later")
     search = movie.get("title")
     await query.answer("This is not available now")
     files, offset, total_results = await get_search_results(search)
@@ -1153,12 +1159,9 @@ async def advantage_spoll_choker(bot, query):
         await auto_filter(bot, query, k)
     else:
         k = await query.message.edit(script.NO_RESULT_TXT)
-        await asyncio.sleep(60)
-        await k.delete()
-        try:
-            await query.message.reply_to_message.delete()
-        except:
-            pass
+        await delete_scheduler.schedule(
+            60, k.chat.id, [k.id, query.message.reply_to_message_id]
+        )
 
 
 @Client.on_callback_query(filters.regex(r"^cfiles"))
@@ -1175,6 +1178,7 @@ async def pmfile_cb(client, query):
 
 
 @Client.on_callback_query()
+@track_handler
 async def cb_handler(client: Client, query: CallbackQuery):
     if query.data == "close_data":
         try:
@@ -1260,6 +1264,7 @@ async def cb_handler(client: Client, query: CallbackQuery):
         user_id = query.from_user.id
         file_id = query.data.split("#", 1)[1]
         log_msg = await client.send_cached_media(chat_id=LOG_CHANNEL, file_id=file_id)
+        warm_file(log_msg.id)
         fileName = quote_plus(get_name(log_msg))
         online = f"{URL}watch/{log_msg.id}/{fileName}?hash={get_hash(log_msg)}"
         download = f"{URL}{log_msg.id}/{fileName}?hash={get_hash(log_msg)}"
@@ -1479,7 +1484,7 @@ async def cb_handler(client: Client, query: CallbackQuery):
 
     elif query.data == "ref_point":
         await query.answer(
-            f"You Have: {referdb.get_refer_points(query.from_user.id)} Refferal points.",
+            f"You Have: {await referdb.get_refer_points(query.from_user.id)} Refferal points.",
             show_alert=True,
         )
 
@@ -1624,18 +1629,8 @@ async def cb_handler(client: Client, query: CallbackQuery):
         deleted = 0
         async with lock:
             try:
-                for file in files:
-                    file_ids = file.file_id
-                    file_name = file.file_name
-                    result = await Media.collection.delete_one(
-                        {
-                            "_id": file_ids,
-                        }
-                    )
-                    if result.deleted_count:
-                        print(f"Successfully deleted {file_name} from database.")
-                    deleted += 1
-                    if deleted % 20 == 0:
+                async for deleted in delete_files([file.file_id for file in files]):
+                    if deleted < total:
                         await query.message.edit_text(
                             f"<b>Process started for deleting files from DB. Successfully deleted {str(deleted)} files from DB for your query {keyword} !\n\nPlease wait...</b>"
                         )
@@ -1651,21 +1646,26 @@ async def cb_handler(client: Client, query: CallbackQuery):
         grp_id = query.message.chat.id
         btn = [[InlineKeyboardButton("☕️ ᴄʟᴏsᴇ ☕️", callback_data="close_data")]]
         reply_markup = InlineKeyboardMarkup(btn)
-        await save_group_settings(grp_id, "shortner", SHORTENER_WEBSITE)
-        await save_group_settings(grp_id, "api", SHORTENER_API)
-        await save_group_settings(grp_id, "shortner_two", SHORTENER_WEBSITE2)
-        await save_group_settings(grp_id, "api_two", SHORTENER_API2)
-        await save_group_settings(grp_id, "shortner_three", SHORTENER_WEBSITE3)
-        await save_group_settings(grp_id, "api_three", SHORTENER_API3)
-        await save_group_settings(grp_id, "verify_time", TWO_VERIFY_GAP)
-        await save_group_settings(grp_id, "third_verify_time", THREE_VERIFY_GAP)
-        await save_group_settings(grp_id, "tutorial", TUTORIAL)
-        await save_group_settings(grp_id, "tutorial_2", TUTORIAL_2)
-        await save_group_settings(grp_id, "tutorial_3", TUTORIAL_3)
-        await save_group_settings(grp_id, "template", IMDB_TEMPLATE)
-        await save_group_settings(grp_id, "caption", FILE_CAPTION)
-        await save_group_settings(grp_id, "fsub_id", AUTH_CHANNEL)
-        await save_group_settings(grp_id, "log", LOG_VR_CHANNEL)
+        await save_default_settings(
+            grp_id,
+            [
+                "shortner",
+                "api",
+                "shortner_two",
+                "api_two",
+                "shortner_three",
+                "api_three",
+                "verify_time",
+                "third_verify_time",
+                "tutorial",
+                "tutorial_2",
+                "tutorial_3",
+                "template",
+                "caption",
+                "fsub_id",
+                "log",
+            ],
+        )
         await query.answer("ꜱᴜᴄᴄᴇꜱꜱғᴜʟʟʏ ʀᴇꜱᴇᴛ...")
         await query.message.edit_text(
             "<b>ꜱᴜᴄᴄᴇꜱꜱғᴜʟʟʏ ʀᴇꜱᴇᴛ ɢʀᴏᴜᴘ ꜱᴇᴛᴛɪɴɢꜱ...\n\nɴᴏᴡ ꜱᴇɴᴅ /details ᴀɢᴀɪɴ</b>",
@@ -1744,8 +1744,7 @@ async def cb_handler(client: Client, query: CallbackQuery):
             ]
             reply_markup = InlineKeyboardMarkup(buttons)
             d = await query.message.edit_reply_markup(reply_markup)
-            await asyncio.sleep(300)
-            await d.delete()
+            await delete_scheduler.schedule(300, d.chat.id, [d.id])
         else:
             await query.message.edit_text("<b>ꜱᴏᴍᴇᴛʜɪɴɢ ᴡᴇɴᴛ ᴡʀᴏɴɢ</b>")
 
@@ -2117,9 +2116,37 @@ async def cb_handler(client: Client, query: CallbackQuery):
         return
 
 
+async def reply_poster(message, imdb, **kwargs):
+    """
+    Replies with the poster of `imdb`, reusing the file_id of an earlier upload.
+    A cached file_id Telegram rejects is forgotten and the poster sent by URL.
+    Only uploads from a URL are saved, a resent file_id comes back different.
+    """
+    url = imdb["poster"]
+    photo = await get_poster_photo(imdb["imdb_id"], url)
+    if not photo.startswith("http"):
+        try:
+            return await message.reply_photo(photo=photo, **kwargs)
+        except BadRequest as e:
+            logger.warning(f"Cached poster of {imdb['imdb_id']} rejected: {e}")
+            await save_poster(imdb["imdb_id"])
+            photo = url
+    try:
+        k = await message.reply_photo(photo=photo, **kwargs)
+    except (MediaEmpty, PhotoInvalidDimensions, WebpageMediaEmpty):
+        photo = url.replace(".jpg", "._V1_UX360.jpg")
+        k = await message.reply_photo(photo=photo, **kwargs)
+    if k.photo:
+        await save_poster(imdb["imdb_id"], k.photo.file_id, photo != url)
+    return k
+
+
 async def ai_spell_check(wrong_name):
     async def search_movie(wrong_name):
-        search_results = imdb.search_movie(wrong_name)
+        try:
+            search_results = await imdb_search(wrong_name, results=20)
+        except Exception:
+            return []
         movie_list = [movie["title"] for movie in search_results]
         return movie_list
 
@@ -2325,47 +2352,22 @@ async def auto_filter(client, msg, spoll=False, pm_mode=False):
     if imdb and imdb.get("poster"):
         try:
             if settings["auto_delete"]:
-                k = await message.reply_photo(
-                    photo=imdb.get("poster"),
+                k = await reply_poster(
+                    message,
+                    imdb,
                     caption=cap[:1024] + links + del_msg,
                     parse_mode=enums.ParseMode.HTML,
                     reply_markup=InlineKeyboardMarkup(btn),
                 )
                 #  await delSticker(st)
-                await asyncio.sleep(DELETE_TIME)
-                await k.delete()
-                try:
-                    await message.delete()
-                except:
-                    pass
-            else:
-                await message.reply_photo(
-                    photo=imdb.get("poster"),
-                    caption=cap[:1024] + links + js_ads,
-                    reply_markup=InlineKeyboardMarkup(btn),
+                await delete_scheduler.schedule(
+                    DELETE_TIME, k.chat.id, [k.id, message.id]
                 )
-        except (MediaEmpty, PhotoInvalidDimensions, WebpageMediaEmpty):
-            pic = imdb.get("poster")
-            poster = pic.replace(".jpg", "._V1_UX360.jpg")
-            if settings["auto_delete"]:
-                k = await message.reply_photo(
-                    photo=poster,
-                    caption=cap[:1024] + links + js_ads,
-                    parse_mode=enums.ParseMode.HTML,
-                    reply_markup=InlineKeyboardMarkup(btn),
-                )
-                # await delSticker(st)
-                await asyncio.sleep(DELETE_TIME)
-                await k.delete()
-                try:
-                    await message.delete()
-                except:
-                    pass
             else:
-                await message.reply_photo(
-                    photo=poster,
+                k = await reply_poster(
+                    message,
+                    imdb,
                     caption=cap[:1024] + links + js_ads,
-                    parse_mode=enums.ParseMode.HTML,
                     reply_markup=InlineKeyboardMarkup(btn),
                 )
         except Exception as e:
@@ -2379,14 +2381,11 @@ async def auto_filter(client, msg, spoll=False, pm_mode=False):
                         reply_markup=InlineKeyboardMarkup(btn),
                         disable_web_page_preview=True,
                     )
+                    await delete_scheduler.schedule(
+                        DELETE_TIME, k.chat.id, [k.id, message.id]
+                    )
                 except Exception as e:
                     print("error", e)
-                await asyncio.sleep(DELETE_TIME)
-                await k.delete()
-                try:
-                    await message.delete()
-                except:
-                    pass
             else:
                 await message.reply_text(
                     cap + links + js_ads,
@@ -2405,12 +2404,9 @@ async def auto_filter(client, msg, spoll=False, pm_mode=False):
         # await delSticker(st)
         if settings["auto_delete"]:
             #  await delSticker(st)
-            await asyncio.sleep(DELETE_TIME)
-            await k.delete()
-            try:
-                await message.delete()
-            except:
-                pass
+            await delete_scheduler.schedule(
+                DELETE_TIME, k.chat.id, [k.id, message.id]
+            )
     return
 
 
@@ -2430,12 +2426,7 @@ async def advantage_spell_chok(message):
         movies = await get_poster(search, bulk=True)
     except:
         k = await message.reply(script.I_CUDNT.format(message.from_user.mention))
-        await asyncio.sleep(60)
-        await k.delete()
-        try:
-            await message.delete()
-        except:
-            pass
+        await delete_scheduler.schedule(60, k.chat.id, [k.id, message.id])
         return
     if not movies:
         google = search.replace(" ", "+")
@@ -2451,18 +2442,13 @@ async def advantage_spell_chok(message):
             text=script.I_CUDNT.format(search),
             reply_markup=InlineKeyboardMarkup(button),
         )
-        await asyncio.sleep(120)
-        await k.delete()
-        try:
-            await message.delete()
-        except:
-            pass
+        await delete_scheduler.schedule(120, k.chat.id, [k.id, message.id])
         return
     user = message.from_user.id if message.from_user else 0
     buttons = [
         [
             InlineKeyboardButton(
-                text=movie.get("title"), callback_data=f"spol#{movie.movieID}#{user}"
+                text=movie.get("title"), callback_data=f"spol#{movie['movieID']}#{user}"
             )
         ]
         for movie in movies
@@ -2475,9 +2461,4 @@ async def advantage_spell_chok(message):
         reply_markup=InlineKeyboardMarkup(buttons),
         reply_to_message_id=message.id,
     )
-    await asyncio.sleep(120)
-    await d.delete()
-    try:
-        await message.delete()
-    except:
-        pass
+    await delete_scheduler.schedule(120, d.chat.id, [d.id, message.id])
@@ -1,14 +1,15 @@
 from aiohttp import web
 import re
-import math
 import logging
 import secrets
 import mimetypes
 from aiohttp.http_exceptions import BadStatusLine
 from Jisshu.bot import multi_clients, work_loads
-from Jisshu.server.exceptions import FIleNotFound, InvalidHash
-from Jisshu.util.custom_dl import ByteStreamer
+from Jisshu.server.exceptions import FIleNotFound, InvalidHash, NoClientAvailable
+from Jisshu.util.custom_dl import get_streamer, is_playable, start_warming
 from Jisshu.util.render_template import render_page
+from Jisshu.util.metrics import bytes_served, render_metrics
+from Jisshu.util.edge_cache import edge_cache
 from info import *
 
 
@@ -20,6 +21,18 @@ async def root_route_handler(request):
     return web.json_response("InfinityBotzz ~ EDITH")
 
 
+@routes.get("/metrics")
+async def metrics_handler(request: web.Request):
+    # Served on the public streaming port, so only to whoever holds the token.
+    if not METRICS_TOKEN:
+        raise web.HTTPNotFound()
+    authorization = request.headers.get("Authorization", "").encode()
+    if not secrets.compare_digest(authorization, f"Bearer {METRICS_TOKEN}".encode()):
+        raise web.HTTPUnauthorized(headers={"WWW-Authenticate": "Bearer"})
+    body, content_type = render_metrics()
+    return web.Response(body=body, headers={"Content-Type": content_type})
+
+
 @routes.get(r"/watch/{path:\S+}", allow_head=True)
 async def stream_handler(request: web.Request):
     try:
@@ -34,6 +47,8 @@ async def stream_handler(request: web.Request):
         return web.Response(
             text=await render_page(id, secure_hash), content_type="text/html"
         )
+    except NoClientAvailable as e:
+        raise no_client_response(e)
     except InvalidHash as e:
         raise web.HTTPForbidden(text=e.message)
     except FIleNotFound as e:
@@ -45,7 +60,7 @@ async def stream_handler(request: web.Request):
         raise web.HTTPInternalServerError(text=str(e))
 
 
-@routes.get(r"/{path:\S+}", allow_head=True)
+@routes.get(r"/{path:\S+}", allow_head=True, name="media")
 async def stream_handler(request: web.Request):
     try:
         path = request.match_info["path"]
@@ -57,6 +72,10 @@ async def stream_handler(request: web.Request):
             id = int(re.search(r"(\d+)(?:\/\S+)?", path).group(1))
             secure_hash = request.rel_url.query.get("hash")
         return await media_streamer(request, id, secure_hash)
+    except web.HTTPException:
+        raise
+    except NoClientAvailable as e:
+        raise no_client_response(e)
     except InvalidHash as e:
         raise web.HTTPForbidden(text=e.message)
     except FIleNotFound as e:
@@ -68,25 +87,36 @@ async def stream_handler(request: web.Request):
         raise web.HTTPInternalServerError(text=str(e))
 
 
-class_cache = {}
+def no_client_response(e: NoClientAvailable) -> web.HTTPServiceUnavailable:
+    # Every client is down and waiting for the supervisor to restart it.
+    return web.HTTPServiceUnavailable(
+        text=e.message, headers={"Retry-After": str(STREAM_RETRY_AFTER)}
+    )
+
+
+# Telegram media never changes once uploaded, so a file's unique id is a
+# strong validator and responses can be cached for as long as a client likes.
+CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+
+def etag_matches(header: str, etag: str) -> bool:
+    """Checks a comma separated If-None-Match / If-Range value against an ETag."""
+    candidates = [tag.strip() for tag in header.split(",")]
+    return "*" in candidates or etag in candidates or f"W/{etag}" in candidates
 
 
 async def media_streamer(request: web.Request, id: int, secure_hash: str):
     range_header = request.headers.get("Range", 0)
 
+    if not work_loads:
+        raise NoClientAvailable
     index = min(work_loads, key=work_loads.get)
     faster_client = multi_clients[index]
 
     if MULTI_CLIENT:
         logging.info(f"Client {index} is now serving {request.remote}")
 
-    if faster_client in class_cache:
-        tg_connect = class_cache[faster_client]
-        logging.debug(f"Using cached ByteStreamer object for client {index}")
-    else:
-        logging.debug(f"Creating new ByteStreamer object for client {index}")
-        tg_connect = ByteStreamer(faster_client)
-        class_cache[faster_client] = tg_connect
+    tg_connect = get_streamer(faster_client)
     logging.debug("before calling get_file_properties")
     file_id = await tg_connect.get_file_properties(id)
     logging.debug("after calling get_file_properties")
@@ -96,14 +126,29 @@ async def media_streamer(request: web.Request, id: int, secure_hash: str):
         raise InvalidHash
 
     file_size = file_id.file_size
+    if is_playable(file_id.mime_type) and edge_cache.missing(
+        file_id.unique_id, file_size
+    ):
+        start_warming(tg_connect, id, index)
+    etag = f'"{file_id.unique_id}"'
+    cache_headers = {"ETag": etag, "Cache-Control": CACHE_CONTROL}
+
+    if_none_match = request.headers.get("If-None-Match")
+    if if_none_match and etag_matches(if_none_match, etag):
+        return web.Response(status=304, headers=cache_headers)
+
+    if_range = request.headers.get("If-Range")
+    if range_header and if_range and if_range.strip() != etag:
+        # The client's copy is stale (or validated by date), send the whole file.
+        range_header = 0
 
     if range_header:
         from_bytes, until_bytes = range_header.replace("bytes=", "").split("-")
         from_bytes = int(from_bytes)
         until_bytes = int(until_bytes) if until_bytes else file_size - 1
     else:
-        from_bytes = request.http_range.start or 0
-        until_bytes = (request.http_range.stop or file_size) - 1
+        from_bytes = 0
+        until_bytes = file_size - 1
 
     if (until_bytes > file_size) or (from_bytes < 0) or (until_bytes < from_bytes):
         return web.Response(
@@ -112,18 +157,8 @@ async def media_streamer(request: web.Request, id: int, secure_hash: str):
             headers={"Content-Range": f"bytes */{file_size}"},
         )
 
-    chunk_size = 1024 * 1024
     until_bytes = min(until_bytes, file_size - 1)
-
-    offset = from_bytes - (from_bytes % chunk_size)
-    first_part_cut = from_bytes - offset
-    last_part_cut = until_bytes % chunk_size + 1
-
     req_length = until_bytes - from_bytes + 1
-    part_count = math.ceil(until_bytes / chunk_size) - math.floor(offset / chunk_size)
-    body = tg_connect.yield_file(
-        file_id, index, offset, first_part_cut, last_part_cut, part_count, chunk_size
-    )
 
     mime_type = file_id.mime_type
     file_name = file_id.file_name
@@ -142,14 +177,45 @@ async def media_streamer(request: web.Request, id: int, secure_hash: str):
             mime_type = "application/octet-stream"
             file_name = f"{secrets.token_hex(2)}.unknown"
 
-    return web.Response(
+    resp = web.StreamResponse(
         status=206 if range_header else 200,
-        body=body,
         headers={
             "Content-Type": f"{mime_type}",
             "Content-Range": f"bytes {from_bytes}-{until_bytes}/{file_size}",
             "Content-Length": str(req_length),
             "Content-Disposition": f'{disposition}; filename="{file_name}"',
             "Accept-Ranges": "bytes",
+            **cache_headers,
         },
     )
+    await resp.prepare(request)
+    if request.method == "HEAD":
+        return resp
+
+    body = tg_connect.yield_file(file_id, index, from_bytes, until_bytes)
+    throttle = request.get("throttle")
+    sent = 0
+    try:
+        async for chunk in body:
+            # write() drains the transport once its buffer is full, so a slow
+            # client holds at most one chunk in memory.
+            await resp.write(chunk)
+            sent += len(chunk)
+            bytes_served.labels(index).inc(len(chunk))
+            if throttle:
+                await throttle.pace(len(chunk))
+    except ConnectionResetError:
+        logging.debug(f"{request.remote} disconnected while streaming {id}")
+        return resp
+    finally:
+        # Runs on disconnect and handler cancellation too, releasing the
+        # media session and the client's work_loads slot right away.
+        await body.aclose()
+        if sent != req_length and request.transport:
+            # Telegram stopped short, drop the connection so the client
+            # doesn't wait forever for the rest of the Content-Length.
+            logging.warning(f"Stream of {id} ended after {sent}/{req_length} bytes")
+            request.transport.close()
+    if sent == req_length:
+        await resp.write_eof()
+    return resp
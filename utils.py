@@ -6,18 +6,34 @@ from pyrogram.errors import (
     UserIsBlocked,
     PeerIdInvalid,
 )
-from info import AUTH_CHANNEL, LONG_IMDB_DESCRIPTION, START_IMG
+from info import (
+    AUTH_CHANNEL,
+    SETTINGS_CACHE_TTL,
+    SUBSCRIPTION_CACHE_TTL,
+    SUBSCRIPTION_CACHE_SIZE,
+    LONG_IMDB_DESCRIPTION,
+    START_IMG,
+    IMDB_WORKERS,
+    IMDB_TIMEOUT,
+    IMDB_CACHE_SIZE,
+)
 from imdb import Cinemagoer
 import asyncio
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
 from pyrogram.types import Message
 from pyrogram import enums
 import pytz
 import re
 import os
 from shortzy import Shortzy
+import time
 from datetime import datetime
 from typing import Any
 from database.users_chats_db import db
+from database.imdbdb import imdb_db
+from Jisshu.util.metrics import flood_waits, cache_requests
 
 
 logger = logging.getLogger(__name__)
@@ -25,6 +41,10 @@ logger.setLevel(logging.INFO)
 
 BANNED = {}
 imdb = Cinemagoer()
+# Cinemagoer does blocking HTTP, so it only ever runs on these threads.
+imdb_executor = ThreadPoolExecutor(IMDB_WORKERS, thread_name_prefix="imdb")
+imdb_cache = OrderedDict()
+imdb_pending = {}
 
 
 class temp(object):
@@ -41,6 +61,9 @@ class temp(object):
     CHAT = {}
     BANNED_USERS = []
     BANNED_CHATS = []
+    JOIN_REQS = set()
+    SUBSCRIBED = OrderedDict()
+    FSUB_CHANNELS = {AUTH_CHANNEL}
 
 
 def formate_file_name(file_name):
@@ -56,21 +79,29 @@ def formate_file_name(file_name):
 
 
 async def is_req_subscribed(bot, query):
-    if await db.find_join_req(query.from_user.id):
+    user_id = query.from_user.id
+    if user_id in temp.JOIN_REQS or is_cached_subscriber(user_id, AUTH_CHANNEL):
         return True
+    cache_requests.labels("subscription", "miss").inc()
     try:
-        user = await bot.get_chat_member(AUTH_CHANNEL, query.from_user.id)
+        user = await bot.get_chat_member(AUTH_CHANNEL, user_id)
     except UserNotParticipant:
         pass
     except Exception as e:
         print(e)
     else:
         if user.status != enums.ChatMemberStatus.BANNED:
+            cache_subscription(user_id, AUTH_CHANNEL)
             return True
     return False
 
 
 async def is_subscribed(bot, user_id, channel_id):
+    # Lets member_updates keep the cache of this channel up to date.
+    temp.FSUB_CHANNELS.add(int(channel_id))
+    if is_cached_subscriber(user_id, channel_id):
+        return True
+    cache_requests.labels("subscription", "miss").inc()
     try:
         user = await bot.get_chat_member(channel_id, user_id)
     except UserNotParticipant:
@@ -79,10 +110,36 @@ async def is_subscribed(bot, user_id, channel_id):
         pass
     else:
         if user.status != enums.ChatMemberStatus.BANNED:
+            cache_subscription(user_id, channel_id)
             return True
     return False
 
 
+def is_cached_subscriber(user_id, channel_id):
+    expires = temp.SUBSCRIBED.get((int(user_id), int(channel_id)))
+    if expires and expires > time.monotonic():
+        cache_requests.labels("subscription", "hit").inc()
+        return True
+    return False
+
+
+def cache_subscription(user_id, channel_id, member=True):
+    """
+    Remembers a confirmed member for SUBSCRIPTION_CACHE_TTL seconds, or forgets
+    them when `member` is False. Only members are cached, so someone who just
+    joined is never turned away by a stale answer.
+    """
+    key = (int(user_id), int(channel_id))
+    if not member:
+        temp.SUBSCRIBED.pop(key, None)
+        return
+    temp.SUBSCRIBED[key] = time.monotonic() + SUBSCRIPTION_CACHE_TTL
+    # Every entry lives as long, so the oldest is also the first to expire.
+    temp.SUBSCRIBED.move_to_end(key)
+    while len(temp.SUBSCRIBED) > SUBSCRIPTION_CACHE_SIZE:
+        temp.SUBSCRIBED.popitem(last=False)
+
+
 async def get_poster(query, bulk=False, id=False, file=None):
     if not id:
         query = (query.strip()).lower()
@@ -97,7 +154,11 @@ async def get_poster(query, bulk=False, id=False, file=None):
                 year = list_to_str(year[:1])
         else:
             year = None
-        movieid = imdb.search_movie(title.lower(), results=10)
+        try:
+            movieid = await imdb_search(title.lower(), results=10)
+        except Exception as e:
+            logger.warning(f"IMDb search for {title!r} failed: {e!r}")
+            return None
         if not movieid:
             return None
         if year:
@@ -113,9 +174,129 @@ async def get_poster(query, bulk=False, id=False, file=None):
             movieid = filtered
         if bulk:
             return movieid
-        movieid = movieid[0].movieID
+        movieid = movieid[0]["movieID"]
     else:
         movieid = query
+    try:
+        return await imdb_movie(movieid)
+    except Exception as e:
+        logger.warning(f"IMDb lookup of {movieid} failed: {e!r}")
+        return None
+
+
+async def run_imdb(func, *args, **kwargs):
+    """Runs a blocking Cinemagoer call on the IMDb pool, giving up after IMDB_TIMEOUT."""
+    loop = asyncio.get_running_loop()
+    return await asyncio.wait_for(
+        loop.run_in_executor(imdb_executor, partial(func, *args, **kwargs)),
+        IMDB_TIMEOUT,
+    )
+
+
+async def imdb_cached(key, func, *args, **kwargs):
+    """
+    Looks a key up in memory, then in MongoDB, then asks IMDb.
+    Concurrent lookups of the same key share one request.
+    """
+    if key in imdb_cache:
+        imdb_cache.move_to_end(key)
+        cache_requests.labels("imdb", "hit").inc()
+        return imdb_cache[key]
+    if key in imdb_pending:
+        return await asyncio.shield(imdb_pending[key])
+    task = asyncio.create_task(_imdb_fetch(key, func, *args, **kwargs))
+    imdb_pending[key] = task
+    task.add_done_callback(lambda _: imdb_pending.pop(key, None))
+    return await asyncio.shield(task)
+
+
+async def _imdb_fetch(key, func, *args, **kwargs):
+    try:
+        found, value = await imdb_db.get(key)
+    except Exception as e:
+        logger.warning(f"IMDb cache read failed for {key}: {e}")
+        found, value = False, None
+    if found:
+        cache_requests.labels("imdb", "hit").inc()
+    else:
+        cache_requests.labels("imdb", "miss").inc()
+        value = await run_imdb(func, *args, **kwargs)
+        try:
+            await imdb_db.set(key, value)
+        except Exception as e:
+            logger.warning(f"IMDb cache write failed for {key}: {e}")
+    _remember_imdb(key, value)
+    return value
+
+
+def _remember_imdb(key, value):
+    imdb_cache[key] = value
+    imdb_cache.move_to_end(key)
+    if len(imdb_cache) > IMDB_CACHE_SIZE:
+        imdb_cache.popitem(last=False)
+
+
+async def get_poster_photo(imdb_id, url):
+    """
+    Returns what to send as a poster: the Telegram file_id of an earlier upload,
+    or the poster URL, already resized if the full size one was rejected before.
+    """
+    key = f"poster:{imdb_id}"
+    entry = imdb_cache.get(key)
+    if entry is None:
+        try:
+            found, entry = await imdb_db.get(key)
+        except Exception as e:
+            logger.warning(f"IMDb cache read failed for {key}: {e}")
+            return url
+        entry = entry or {}
+        _remember_imdb(key, entry)
+    if entry.get("file_id"):
+        cache_requests.labels("poster", "hit").inc()
+        return entry["file_id"]
+    cache_requests.labels("poster", "miss").inc()
+    if entry.get("resized"):
+        return url.replace(".jpg", "._V1_UX360.jpg")
+    return url
+
+
+async def save_poster(imdb_id, file_id=None, resized=False):
+    """
+    Remembers the file_id Telegram gave a poster, or that its URL needs resizing.
+    Without a file_id it forgets a cached upload Telegram no longer accepts.
+    """
+    key = f"poster:{imdb_id}"
+    entry = {"file_id": file_id, "resized": resized}
+    _remember_imdb(key, entry)
+    try:
+        await imdb_db.set(key, entry)
+    except Exception as e:
+        logger.warning(f"IMDb cache write failed for {key}: {e}")
+
+
+async def imdb_search(title, results=10):
+    """Returns [{movieID, title, year, kind}] for an IMDb title search."""
+    return await imdb_cached(f"search:{results}:{title}", _search_movie, title, results)
+
+
+async def imdb_movie(movieid):
+    """Returns the details get_poster() hands out for an IMDb id."""
+    return await imdb_cached(f"movie:{movieid}", _get_movie, movieid)
+
+
+def _search_movie(title, results):
+    return [
+        {
+            "movieID": movie.movieID,
+            "title": movie.get("title"),
+            "year": movie.get("year"),
+            "kind": movie.get("kind"),
+        }
+        for movie in imdb.search_movie(title, results=results)
+    ]
+
+
+def _get_movie(movieid):
     movie = imdb.get_movie(movieid)
     if movie.get("original air date"):
         date = movie["original air date"]
@@ -171,6 +352,7 @@ async def users_broadcast(user_id, message, is_pin):
             await m.pin(both_sides=True)
         return True, "Success"
     except FloodWait as e:
+        flood_waits.labels("copy_message").inc()
         await asyncio.sleep(e.x)
         return await users_broadcast(user_id, message)
     except InputUserDeactivated:
@@ -200,6 +382,7 @@ async def groups_broadcast(chat_id, message, is_pin):
                 pass
         return "Success"
     except FloodWait as e:
+        flood_waits.labels("copy_message").inc()
         await asyncio.sleep(e.x)
         return await groups_broadcast(chat_id, message)
     except Exception:
@@ -209,14 +392,55 @@ async def groups_broadcast(chat_id, message, is_pin):
 
 
 async def get_settings(group_id):
-    settings = await db.get_settings(int(group_id))
-    return settings
+    group_id = int(group_id)
+    cached = temp.SETTINGS.get(group_id)
+    if cached and cached[0] > time.monotonic():
+        cache_requests.labels("settings", "hit").inc()
+        return dict(cached[1])
+    cache_requests.labels("settings", "miss").inc()
+    settings = await db.get_settings(group_id)
+    cache_settings(group_id, settings)
+    return dict(settings)
 
 
 async def save_group_settings(group_id, key, value):
-    current = await get_settings(group_id)
-    current[key] = value
-    await db.update_settings(group_id, current)
+    await db.update_settings_keys(group_id, {key: value})
+
+
+async def update_group_settings(group_id, changes):
+    """Saves several settings of a group in one round trip."""
+    await db.update_settings_keys(group_id, changes)
+
+
+def cache_settings(group_id, settings=None):
+    """Stores a group's settings in temp.SETTINGS, or forgets them when settings is None."""
+    if settings is None:
+        temp.SETTINGS.pop(int(group_id), None)
+    else:
+        expires = time.monotonic() + SETTINGS_CACHE_TTL
+        temp.SETTINGS[int(group_id)] = (expires, dict(settings))
+
+
+# Every settings write through db, from this module or not, refreshes the cache.
+db.settings_hooks.append(cache_settings)
+
+
+async def watch_settings():
+    """Forgets cached settings of groups another instance has updated."""
+    pipeline = [{"$match": {"operationType": {"$in": ["update", "replace", "delete"]}}}]
+    while True:
+        try:
+            async with db.grp.watch(pipeline, full_document="updateLookup") as stream:
+                async for change in stream:
+                    group = change.get("fullDocument") or {}
+                    if "id" in group:
+                        cache_settings(group["id"])
+                    else:
+                        temp.SETTINGS.clear()
+        except Exception as e:
+            logger.warning(f"Settings change stream stopped: {e}")
+            temp.SETTINGS.clear()
+            await asyncio.sleep(SETTINGS_CACHE_TTL)
 
 
 def get_size(size):
@@ -349,7 +573,6 @@ def get_readable_time(seconds):
     return result
 
 
-async def save_default_settings(id):
-    await db.reset_group_settings(id)
-    current = await db.get_settings(id)
-    temp.SETTINGS.update({id: current})
+async def save_default_settings(id, keys=None):
+    """Resets a group's settings, or only the given keys, to the defaults."""
+    await db.reset_group_settings(id, keys)